@@ -0,0 +1,177 @@
+import os
+import re
+import time
+import heapq
+import asyncio
+import itertools
+from collections import OrderedDict
+from typing import Optional
+from .metrics import ADMISSION_QUEUE_DEPTH, ADMISSION_WAIT, ADMISSION_SHED
+
+# Token buckets (per worker process): RATE_LIMIT_PER_MIN for everyone together,
+# RATE_LIMIT_KEY_PER_MIN per API key / client address. 0 disables a limit.
+RATE_LIMIT_PER_MIN = float(os.getenv("RATE_LIMIT_PER_MIN", "0"))
+RATE_LIMIT_KEY_PER_MIN = float(os.getenv("RATE_LIMIT_KEY_PER_MIN", "0"))
+RATE_LIMIT_BURST = int(os.getenv("RATE_LIMIT_BURST", "0"))  # 0 = 10s worth of tokens
+# Requests over the global rate wait in a priority queue, bounded in size and time.
+ADMISSION_QUEUE_SIZE = int(os.getenv("ADMISSION_QUEUE_SIZE", "100"))
+ADMISSION_MAX_WAIT_S = float(os.getenv("ADMISSION_MAX_WAIT_S", "5"))
+ADMISSION_MAX_KEYS = 10000
+
+PRIORITY_LABELS = ("urgent", "normal", "low")
+
+# Cheap pre-score so likely-P0 tickets are admitted first; the classifier decides the real urgency.
+_URGENT = re.compile(
+    r"\b(outage|down|breach|compromised|ransomware|malware|all users|everyone|production|urgent|emergency|critical"
+    r"|cannot|can't|blocked)\b", re.I)
+_LOW = re.compile(r"\b(how do i|how to|documentation|docs|question|understand|wondering|feature request)\b", re.I)
+
+def prescore(text: str) -> int:
+    """0 = likely P0, 1 = normal, 2 = likely P3 (how-to)."""
+    if _URGENT.search(text):
+        return 0
+    if _LOW.search(text):
+        return 2
+    return 1
+
+class AdmissionRejected(Exception):
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+class AdmissionTooLarge(ValueError):
+    """More tokens than a bucket can ever hold: waiting won't help, the caller must split the work."""
+
+class TokenBucket:
+    def __init__(self, rate_per_s: float, capacity: float):
+        self.rate = rate_per_s
+        self.capacity = max(1.0, capacity)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def take(self, cost: float = 1.0) -> float:
+        """Take `cost` tokens and return 0, or return the seconds until they'd be available.
+
+        `cost` must not exceed capacity (admit() checks), or it would never be available."""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= cost:
+            self.tokens -= cost
+            return 0.0
+        return (cost - self.tokens) / self.rate
+
+def _bucket(per_min: float) -> TokenBucket:
+    rate = per_min / 60.0
+    return TokenBucket(rate, RATE_LIMIT_BURST or rate * 10)
+
+class AdmissionController:
+    """Token-bucket admission with a bounded priority wait queue and load shedding.
+
+    Over a per-key limit a request is rejected at once. Over the global limit
+    it waits, ordered by (prescore, arrival), unless the queue is full (a
+    lower-priority waiter is evicted to make room, if there is one) or its
+    expected wait exceeds max_wait_s. Rejections carry a Retry-After.
+    """
+
+    def __init__(self, per_min: float = RATE_LIMIT_PER_MIN, key_per_min: float = RATE_LIMIT_KEY_PER_MIN,
+                 queue_size: int = ADMISSION_QUEUE_SIZE, max_wait_s: float = ADMISSION_MAX_WAIT_S):
+        self.global_bucket = _bucket(per_min) if per_min > 0 else None
+        self.key_per_min = key_per_min
+        self.queue_size = queue_size
+        self.max_wait_s = max_wait_s
+        self._keys: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        self._heap = []  # (priority, seq, cost, future)
+        self._seq = itertools.count()
+        self._pump_task = None
+
+    def _key_bucket(self, key: str) -> TokenBucket:
+        bucket = self._keys.pop(key, None) or _bucket(self.key_per_min)
+        self._keys[key] = bucket
+        if len(self._keys) > ADMISSION_MAX_KEYS:
+            self._keys.popitem(last=False)
+        return bucket
+
+    def _shed(self, reason: str, retry_after: float):
+        ADMISSION_SHED.labels(reason=reason).inc()
+        return AdmissionRejected(reason, retry_after)
+
+    async def admit(self, key: Optional[str], text: str, cost: float = 1.0):
+        """Return once the request may proceed; raises AdmissionRejected to shed it.
+
+        `cost` is charged in full (a batch pays one token per ticket); a cost above
+        a bucket's capacity raises AdmissionTooLarge.
+        """
+        key_bucket = self._key_bucket(key) if self.key_per_min > 0 and key else None
+        capacities = [b.capacity for b in (key_bucket, self.global_bucket) if b is not None]
+        if capacities and cost > min(capacities):
+            ADMISSION_SHED.labels(reason="too_large").inc()
+            raise AdmissionTooLarge(f"cost {cost:g} exceeds the rate limit burst of {min(capacities):g}")
+        if key_bucket is not None:
+            wait = key_bucket.take(cost)
+            if wait:
+                raise self._shed("key_limit", wait)
+        if self.global_bucket is None:
+            return
+
+        priority = prescore(text)
+        label = PRIORITY_LABELS[priority]
+        if not self._heap and not self.global_bucket.take(cost):
+            ADMISSION_WAIT.labels(priority=label).observe(0)
+            return
+
+        ahead = sum(c for p, _, c, f in self._heap if p <= priority and not f.done())
+        expected = (ahead + cost) / self.global_bucket.rate
+        if expected > self.max_wait_s:
+            raise self._shed("overload", expected)
+        if len(self._heap) >= self.queue_size and not self._evict_below(priority):
+            raise self._shed("queue_full", expected)
+
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._heap, (priority, next(self._seq), cost, fut))
+        ADMISSION_QUEUE_DEPTH.set(len(self._heap))
+        if self._pump_task is None:
+            self._pump_task = asyncio.get_running_loop().create_task(self._pump())
+
+        t0 = time.perf_counter()
+        try:
+            await asyncio.wait_for(fut, self.max_wait_s)
+        except asyncio.TimeoutError:
+            raise self._shed("timeout", expected)
+        ADMISSION_WAIT.labels(priority=label).observe(time.perf_counter() - t0)
+
+    def _evict_below(self, priority: int) -> bool:
+        # make room by shedding the newest waiter of the lowest priority, if it ranks below us
+        live = [e for e in self._heap if not e[3].done()]
+        if len(live) < len(self._heap):
+            self._heap = live
+            heapq.heapify(self._heap)
+            if len(self._heap) < self.queue_size:
+                return True
+        worst = max(self._heap, default=None, key=lambda e: (e[0], e[1]))
+        if worst is None or worst[0] <= priority:
+            return False
+        self._heap.remove(worst)
+        heapq.heapify(self._heap)
+        worst[3].set_exception(self._shed("evicted", self.max_wait_s))
+        return True
+
+    async def _pump(self):
+        # release waiters in priority order as tokens become available
+        try:
+            while self._heap:
+                _, _, cost, fut = self._heap[0]
+                if fut.done():  # timed out or client went away
+                    heapq.heappop(self._heap)
+                    continue
+                wait = self.global_bucket.take(cost)
+                if wait:
+                    await asyncio.sleep(wait)
+                    continue
+                heapq.heappop(self._heap)
+                fut.set_result(None)
+                ADMISSION_QUEUE_DEPTH.set(len(self._heap))
+        finally:
+            ADMISSION_QUEUE_DEPTH.set(len(self._heap))
+            self._pump_task = None
@@ -0,0 +1,156 @@
+import os
+import re
+import json
+import tempfile
+from collections import Counter, defaultdict
+from typing import Iterable, List, Optional, Tuple
+import numpy as np
+
+# Keeps exact tokens like ERR_CONN_RESET, npa-gw-01, 403, v2.1 intact.
+_TOKEN = re.compile(r"[a-z0-9](?:[a-z0-9_.\-]*[a-z0-9])?")
+_STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have how i in is it its of on or that the this to was "
+    "we what when where which who will with you your".split()
+)
+
+# documents per sorted run spilled to disk while building
+BM25_BUILD_BATCH_DOCS = int(os.getenv("BM25_BUILD_BATCH_DOCS", "20000"))
+
+FILES = ("bm25_terms.json", "bm25_offsets.npy", "bm25_postings.npy", "bm25_weights.npy", "bm25_ids.npy")
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in _TOKEN.findall(text.lower()) if t not in _STOPWORDS]
+
+class BM25Index:
+    """Okapi BM25 over CSR posting lists.
+
+    Postings for term t are postings[offsets[t]:offsets[t+1]] (doc positions)
+    with precomputed per-posting BM25 weights, so a query is a few slices,
+    one bincount-style reduction and an argpartition. ids maps doc position
+    -> faiss id, so results line up with the dense index.
+    """
+
+    def __init__(self, terms: dict, offsets: np.ndarray, postings: np.ndarray, weights: np.ndarray, ids: np.ndarray):
+        self.terms = terms
+        self.offsets = offsets
+        self.postings = postings
+        self.weights = weights
+        self.ids = ids
+
+    @classmethod
+    def build(cls, docs: Iterable[Tuple[int, str]], k1: float = 1.2, b: float = 0.75,
+              spill_dir: Optional[str] = None, batch_docs: int = BM25_BUILD_BATCH_DOCS) -> "BM25Index":
+        """Build from (faiss id, text) pairs in bounded memory.
+
+        Every batch_docs documents the batch's (term, doc pos, tf) triples are
+        sorted by term and spilled to a run file under spill_dir; the runs are
+        then merged straight into the CSR arrays. Only the vocabulary, the
+        per-doc arrays and the final postings/weights are ever held in full.
+        """
+        term_ids: dict = {}
+        df = np.zeros(0, dtype=np.int64)
+        ids, doc_len = [], []
+        with tempfile.TemporaryDirectory(prefix="bm25-", dir=spill_dir) as tmp:
+            runs = []
+            batch_tids, batch_pos, batch_tf = [], [], []
+
+            def spill():
+                nonlocal df
+                tids = np.asarray(batch_tids, dtype=np.int32)
+                pos = np.asarray(batch_pos, dtype=np.int32)
+                order = np.lexsort((pos, tids))
+                path = os.path.join(tmp, f"run{len(runs)}.npz")
+                np.savez(path, tids=tids[order], pos=pos[order], tf=np.asarray(batch_tf, dtype=np.float32)[order])
+                runs.append(path)
+                counts = np.bincount(tids, minlength=len(term_ids))
+                df = np.concatenate([df, np.zeros(len(counts) - len(df), dtype=np.int64)]) + counts
+                batch_tids.clear(), batch_pos.clear(), batch_tf.clear()
+
+            for pos, (doc_id, text) in enumerate(docs):
+                tokens = tokenize(text)
+                ids.append(doc_id)
+                doc_len.append(len(tokens))
+                for term, tf in Counter(tokens).items():
+                    batch_tids.append(term_ids.setdefault(term, len(term_ids)))
+                    batch_pos.append(pos)
+                    batch_tf.append(tf)
+                if (pos + 1) % batch_docs == 0:
+                    spill()
+            if batch_tids:
+                spill()
+
+            n = len(ids)
+            dl = np.asarray(doc_len, dtype=np.float32)
+            avgdl = float(dl.mean()) if n else 1.0
+            df = np.concatenate([df, np.zeros(len(term_ids) - len(df), dtype=np.int64)])
+            idf = np.log(1.0 + (n - df + 0.5) / (df + 0.5)).astype(np.float32)
+            offsets = np.zeros(len(term_ids) + 1, dtype=np.int64)
+            np.cumsum(df, out=offsets[1:])
+            postings = np.empty(offsets[-1], dtype=np.int32)
+            weights = np.empty(offsets[-1], dtype=np.float32)
+            # runs cover ascending doc positions, so appending run by run keeps each posting list sorted
+            fill = offsets[:-1].copy()
+            for path in runs:
+                with np.load(path) as run:
+                    tids, pos, tf = run["tids"], run["pos"], run["tf"]
+                starts = np.searchsorted(tids, tids, side="left")
+                dest = fill[tids] + (np.arange(len(tids)) - starts)
+                postings[dest] = pos
+                weights[dest] = idf[tids] * tf * (k1 + 1) / (tf + k1 * (1 - b + b * dl[pos] / avgdl))
+                fill += np.bincount(tids, minlength=len(fill))
+                os.remove(path)
+        return cls(term_ids, offsets, postings, weights, np.asarray(ids, dtype=np.int64))
+
+    def search(self, query: str, k: int, allowed: Optional[np.ndarray] = None) -> List[Tuple[int, float]]:
+        """Top-k (faiss id, score); `allowed` (sorted ids) restricts results to a subset."""
+        tids = [self.terms[t] for t in set(tokenize(query)) if t in self.terms]
+        if not tids:
+            return []
+        docs = np.concatenate([self.postings[self.offsets[t]:self.offsets[t + 1]] for t in tids])
+        weights = np.concatenate([self.weights[self.offsets[t]:self.offsets[t + 1]] for t in tids])
+        uniq, inv = np.unique(docs, return_inverse=True)
+        scores = np.bincount(inv, weights=weights)
+        if allowed is not None:
+            keep = np.isin(self.ids[uniq], allowed, assume_unique=True)
+            uniq, scores = uniq[keep], scores[keep]
+            if not len(uniq):
+                return []
+        top = np.argpartition(-scores, k - 1)[:k] if len(scores) > k else np.arange(len(scores))
+        top = top[np.argsort(-scores[top])]
+        return [(int(self.ids[uniq[i]]), float(scores[i])) for i in top]
+
+    def __len__(self):
+        return len(self.ids)
+
+    def save(self, store_dir: str):
+        arrays = {"bm25_offsets.npy": self.offsets, "bm25_postings.npy": self.postings,
+                  "bm25_weights.npy": self.weights, "bm25_ids.npy": self.ids}
+        for name, arr in arrays.items():
+            path = os.path.join(store_dir, name)
+            with open(path + ".tmp", "wb") as f:
+                np.save(f, arr)
+            os.replace(path + ".tmp", path)
+        path = os.path.join(store_dir, "bm25_terms.json")
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(sorted(self.terms, key=self.terms.get), f, ensure_ascii=False)
+        os.replace(path + ".tmp", path)
+
+    @classmethod
+    def load(cls, store_dir: str) -> Optional["BM25Index"]:
+        if not all(os.path.exists(os.path.join(store_dir, n)) for n in FILES):
+            return None
+        with open(os.path.join(store_dir, "bm25_terms.json"), "r", encoding="utf-8") as f:
+            terms = {t: i for i, t in enumerate(json.load(f))}
+
+        def arr(name):
+            return np.load(os.path.join(store_dir, name), mmap_mode="r")
+
+        return cls(terms, arr("bm25_offsets.npy"), arr("bm25_postings.npy"), arr("bm25_weights.npy"), arr("bm25_ids.npy"))
+
+def rrf_fuse(rankings: List[List[int]], k: int, k0: int = 60) -> List[Tuple[int, float]]:
+    """Reciprocal-rank fusion: score(d) = sum over rankings of 1 / (k0 + rank)."""
+    scores: dict = defaultdict(float)
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking, start=1):
+            scores[doc] += 1.0 / (k0 + rank)
+    return sorted(scores.items(), key=lambda x: -x[1])[:k]
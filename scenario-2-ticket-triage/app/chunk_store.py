@@ -0,0 +1,165 @@
+import os
+import mmap
+from collections.abc import Mapping
+from dataclasses import dataclass
+from typing import Iterable, Iterator, Optional, Tuple
+import numpy as np
+
+@dataclass
+class DocChunk:
+    doc_id: str
+    text: str
+    content_hash: str = ""
+
+# One row per chunk, sorted by id. doc_id and text are stored back to back in the blob.
+ROW_DTYPE = np.dtype([
+    ("id", "<i8"),
+    ("offset", "<i8"),
+    ("doc_len", "<i4"),
+    ("text_len", "<i4"),
+    ("hash", "S32"),
+])
+
+BLOB_FILE = "chunks.bin"
+TABLE_FILE = "chunks.idx.npy"
+
+class ChunkStore(Mapping):
+    """Read-only, memory-mapped chunk store: faiss id -> DocChunk.
+
+    Opening only maps the files, so it is O(1) in corpus size and worker
+    processes share the page cache. A DocChunk is decoded only when looked up.
+    """
+
+    def __init__(self, store_dir: str):
+        self._table = np.load(os.path.join(store_dir, TABLE_FILE), mmap_mode="r")
+        self._ids = self._table["id"]
+        with open(os.path.join(store_dir, BLOB_FILE), "rb") as f:
+            # mmap of an empty file is not allowed
+            self._blob = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(f.fileno()).st_size else b""
+
+    @staticmethod
+    def exists(store_dir: str) -> bool:
+        return all(os.path.exists(os.path.join(store_dir, n)) for n in (BLOB_FILE, TABLE_FILE))
+
+    def _row(self, chunk_id: int) -> Optional[np.void]:
+        pos = int(np.searchsorted(self._ids, chunk_id))
+        if pos >= len(self._ids) or self._ids[pos] != chunk_id:
+            return None
+        return self._table[pos]
+
+    def _decode(self, row) -> DocChunk:
+        start, doc_len, text_len = int(row["offset"]), int(row["doc_len"]), int(row["text_len"])
+        raw = self._blob[start:start + doc_len + text_len]
+        return DocChunk(
+            doc_id=raw[:doc_len].decode("utf-8"),
+            text=raw[doc_len:].decode("utf-8"),
+            content_hash=row["hash"].decode("ascii"),
+        )
+
+    def __getitem__(self, chunk_id: int) -> DocChunk:
+        row = self._row(chunk_id)
+        if row is None:
+            raise KeyError(chunk_id)
+        return self._decode(row)
+
+    def __contains__(self, chunk_id) -> bool:
+        return self._row(chunk_id) is not None
+
+    def __iter__(self) -> Iterator[int]:
+        return (int(i) for i in self._ids)
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def doc_ids(self) -> dict:
+        """doc_id -> id, decoding only the doc_id part of each record."""
+        out = {}
+        for row in self._table:
+            start = int(row["offset"])
+            out[self._blob[start:start + int(row["doc_len"])].decode("utf-8")] = int(row["id"])
+        return out
+
+    def hash_of(self, chunk_id: int) -> Optional[str]:
+        row = self._row(chunk_id)
+        return None if row is None else row["hash"].decode("ascii")
+
+class ChunkStoreWriter:
+    """Appends chunks to <store>/chunks.bin.tmp and publishes the store on close().
+
+    checkpoint() persists the rows written so far. A writer created with
+    resume_rows=n continues after the first n checkpointed rows (the blob is
+    truncated to match); raises ValueError if the checkpoint has fewer rows.
+    """
+
+    def __init__(self, store_dir: str, resume_rows: Optional[int] = None):
+        os.makedirs(store_dir, exist_ok=True)
+        self.blob_path = os.path.join(store_dir, BLOB_FILE)
+        self.table_path = os.path.join(store_dir, TABLE_FILE)
+        self.ckpt_path = os.path.join(store_dir, "chunks.idx.ckpt.npy")
+        self.rows = []
+        self.offset = 0
+        if resume_rows is None:
+            self._f = open(self.blob_path + ".tmp", "wb")
+            return
+
+        table = np.load(self.ckpt_path) if os.path.exists(self.ckpt_path) else np.zeros(0, dtype=ROW_DTYPE)
+        if len(table) < resume_rows:
+            raise ValueError(f"checkpoint has {len(table)} rows, expected {resume_rows}")
+        self.rows = [tuple(r) for r in table[:resume_rows].tolist()]
+        if self.rows:
+            _, offset, doc_len, text_len, _ = self.rows[-1]
+            self.offset = offset + doc_len + text_len
+        self._f = open(self.blob_path + ".tmp", "r+b")
+        self._f.truncate(self.offset)
+        self._f.seek(self.offset)
+
+    def add(self, chunk_id: int, c: DocChunk):
+        doc = c.doc_id.encode("utf-8")
+        text = c.text.encode("utf-8")
+        self._f.write(doc)
+        self._f.write(text)
+        self.rows.append((chunk_id, self.offset, len(doc), len(text), c.content_hash.encode("ascii")))
+        self.offset += len(doc) + len(text)
+
+    def doc_ids(self) -> dict:
+        """doc_id -> id of everything written so far (used when resuming)."""
+        self._f.flush()
+        out = {}
+        with open(self.blob_path + ".tmp", "rb") as f:
+            for chunk_id, offset, doc_len, _, _ in self.rows:
+                f.seek(offset)
+                out[f.read(doc_len).decode("utf-8")] = chunk_id
+        return out
+
+    def checkpoint(self):
+        self._f.flush()
+        os.fsync(self._f.fileno())
+        with open(self.ckpt_path + ".tmp", "wb") as f:
+            np.save(f, np.array(self.rows, dtype=ROW_DTYPE))
+        os.replace(self.ckpt_path + ".tmp", self.ckpt_path)
+
+    def close(self):
+        self._f.close()
+        table = np.array(self.rows, dtype=ROW_DTYPE)
+        table.sort(order="id")
+        with open(self.table_path + ".tmp", "wb") as f:
+            np.save(f, table)
+        # replace, don't overwrite: running workers keep their mapping of the old files
+        os.replace(self.blob_path + ".tmp", self.blob_path)
+        os.replace(self.table_path + ".tmp", self.table_path)
+        if os.path.exists(self.ckpt_path):
+            os.remove(self.ckpt_path)
+
+    def abort(self):
+        """Drop everything written (nothing changed, or the ingest failed for good)."""
+        self._f.close()
+        for path in (self.blob_path + ".tmp", self.ckpt_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+def write_chunk_store(store_dir: str, items: Iterable[Tuple[int, DocChunk]]):
+    """Stream (id, chunk) pairs into the blob; only the small row table is kept in memory."""
+    writer = ChunkStoreWriter(store_dir)
+    for chunk_id, c in items:
+        writer.add(chunk_id, c)
+    writer.close()
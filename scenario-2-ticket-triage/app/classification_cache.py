@@ -0,0 +1,149 @@
+import os
+import hashlib
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+from sqlalchemy import select
+from sqlalchemy.exc import SQLAlchemyError
+
+from .db import SessionLocal
+from .models import Ticket
+from .gemini_classifier import (
+    CLASSIFICATION_PROMPT,
+    FALLBACK_PREFIX,
+    classify_with_gemini_async,
+    classify_batch_with_gemini_async,
+    current_model_name,
+)
+from .local_classifier import knn
+from .lru import LRUTTLCache, normalize_text
+from .metrics import CLASSIFY_CACHE_HITS, CLASSIFY_CACHE_MISSES
+from .tracing import span
+
+log = logging.getLogger("triage.classify_cache")
+
+CLASSIFY_CACHE_SIZE = int(os.getenv("CLASSIFY_CACHE_SIZE", "10000"))
+CLASSIFY_CACHE_TTL_S = float(os.getenv("CLASSIFY_CACHE_TTL_S", "3600"))
+# Shared tier: look up earlier classifications of the same key in the tickets table.
+CLASSIFY_CACHE_SHARED = os.getenv("CLASSIFY_CACHE_SHARED", "0") == "1"
+
+# Any edit to the prompt invalidates every cached classification.
+PROMPT_HASH = hashlib.sha256(CLASSIFICATION_PROMPT.encode("utf-8")).hexdigest()[:16]
+
+def cache_key(text: str, model_name: str) -> str:
+    raw = f"{model_name}\x00{PROMPT_HASH}\x00{normalize_text(text)}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+_memory = LRUTTLCache(CLASSIFY_CACHE_SIZE, CLASSIFY_CACHE_TTL_S, name="classification")
+
+def _shared_query(keys: List[str]):
+    """The newest stored classification per key (DISTINCT ON: exactly one row per key, however many share one)."""
+    cutoff = datetime.utcnow() - timedelta(seconds=CLASSIFY_CACHE_TTL_S)
+    return (
+        select(
+            Ticket.classification_key,
+            Ticket.product_area,
+            Ticket.urgency,
+            Ticket.classification_reason,
+            Ticket.classifier_model,
+        )
+        .where(
+            Ticket.classification_key.in_(keys),
+            Ticket.created_at >= cutoff,
+            ~Ticket.classification_reason.startswith(FALLBACK_PREFIX),
+        )
+        .distinct(Ticket.classification_key)
+        .order_by(Ticket.classification_key, Ticket.id.desc())
+    )
+
+async def _lookup_shared(keys: List[str]) -> Dict[str, dict]:
+    try:
+        with span("cache.shared_lookup"):
+            async with SessionLocal() as session:
+                rows = (await session.execute(_shared_query(keys))).all()
+    except SQLAlchemyError as e:
+        log.warning(f"shared classification cache lookup failed: {e}", extra={"operation": "classify_cache"})
+        return {}
+    return {
+        key: {"product_area": product, "urgency": urgency, "reason": reason or "", "model": model}
+        for key, product, urgency, reason, model in rows
+    }
+
+async def classify_cached(ticket_text: str) -> tuple[dict, str]:
+    """Classify via the cache tiers, falling through to the local kNN tier and then Gemini on a miss.
+
+    Returns (result, key); callers store the key on the Ticket row so it can
+    serve as the shared tier for other workers.
+    """
+    key = cache_key(ticket_text, current_model_name())
+
+    result = _memory.get(key)
+    if result is not None:
+        CLASSIFY_CACHE_HITS.labels(tier="memory").inc()
+        return result, key
+
+    if CLASSIFY_CACHE_SHARED:
+        result = (await _lookup_shared([key])).get(key)
+        if result is not None:
+            CLASSIFY_CACHE_HITS.labels(tier="shared").inc()
+            _memory.put(key, result)
+            return result, key
+
+    CLASSIFY_CACHE_MISSES.inc()
+    # cascade: the local kNN tier answers when confident, Gemini otherwise
+    result = await knn.classify(ticket_text)
+    if result is None:
+        result = await classify_with_gemini_async(ticket_text)
+    # don't pin parse-error fallbacks; the next attempt may succeed
+    if not result["reason"].startswith(FALLBACK_PREFIX):
+        _memory.put(key, result)
+    return result, key
+
+async def classify_batch_cached(texts: List[str]) -> tuple[List[dict], List[str]]:
+    """Batch counterpart of classify_cached; only distinct misses reach Gemini."""
+    model_name = current_model_name()
+    keys = [cache_key(t, model_name) for t in texts]
+    found: Dict[str, dict] = {}
+
+    for key in set(keys):
+        result = _memory.get(key)
+        if result is not None:
+            found[key] = result
+    CLASSIFY_CACHE_HITS.labels(tier="memory").inc(sum(1 for k in keys if k in found))
+
+    if CLASSIFY_CACHE_SHARED:
+        pending = [k for k in set(keys) if k not in found]
+        if pending:
+            shared = await _lookup_shared(pending)
+            for key, result in shared.items():
+                _memory.put(key, result)
+            found.update(shared)
+            CLASSIFY_CACHE_HITS.labels(tier="shared").inc(sum(1 for k in keys if k in shared))
+
+    # de-duplicate identical tickets within the batch before calling Gemini
+    miss_texts: Dict[str, str] = {}
+    for key, text in zip(keys, texts):
+        if key not in found:
+            miss_texts.setdefault(key, text)
+    CLASSIFY_CACHE_MISSES.inc(sum(1 for k in keys if k not in found))
+
+    if miss_texts:
+        miss_keys = list(miss_texts)
+        local = await knn.classify_many([miss_texts[k] for k in miss_keys])
+        for key, result in zip(miss_keys, local):
+            if result is not None:
+                found[key] = result
+                _memory.put(key, result)
+        miss_keys = [k for k in miss_keys if k not in found]
+        classified = await classify_batch_with_gemini_async([miss_texts[k] for k in miss_keys]) if miss_keys else []
+        for key, result in zip(miss_keys, classified):
+            found[key] = result
+            if not result["reason"].startswith(FALLBACK_PREFIX):
+                _memory.put(key, result)
+
+    return [found[k] for k in keys], keys
+
+def degraded_classification(text: str, why: str):
+    """Placeholder classification when the classifier can't answer in time; never cached."""
+    result = {"product_area": "OTHER", "urgency": "P2", "reason": f"{FALLBACK_PREFIX} {why}", "model": "degraded"}
+    return result, cache_key(text, current_model_name())
@@ -7,5 +7,23 @@ Base = declarative_base()
 def get_engine():
     return create_async_engine(os.environ["DATABASE_URL"], pool_pre_ping=True)
 
-engine = get_engine()
-SessionLocal = async_sessionmaker(bind=engine, expire_on_commit=False, class_=AsyncSession)
+# Built on first use, so modules that only may touch the DB (e.g. the offline
+# in-process eval pipeline) import without DATABASE_URL.
+_engine = None
+_sessions = None
+
+def _sessionmaker() -> async_sessionmaker:
+    global _engine, _sessions
+    if _sessions is None:
+        _engine = get_engine()
+        _sessions = async_sessionmaker(bind=_engine, expire_on_commit=False, class_=AsyncSession)
+    return _sessions
+
+def SessionLocal() -> AsyncSession:
+    return _sessionmaker()()
+
+def __getattr__(name):
+    if name == "engine":
+        _sessionmaker()
+        return _engine
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
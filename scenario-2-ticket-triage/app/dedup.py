@@ -0,0 +1,89 @@
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+import numpy as np
+import faiss
+from .metrics import DEDUP_CHECKS, DEDUP_INDEX_SIZE
+
+# /respond reuses the answer of a recent near-identical ticket instead of running the pipeline.
+DEDUP_ENABLED = os.getenv("DEDUP_ENABLED", "1") == "1"
+DEDUP_MIN_SIMILARITY = float(os.getenv("DEDUP_MIN_SIMILARITY", "0.95"))
+DEDUP_WINDOW_S = float(os.getenv("DEDUP_WINDOW_S", "3600"))
+DEDUP_MAX_TICKETS = int(os.getenv("DEDUP_MAX_TICKETS", "5000"))
+
+@dataclass
+class RecentTicket:
+    """What a duplicate gets back: the original's classification and answer."""
+    ticket_id: int
+    classification: dict
+    answer: str
+    citations: List[dict]
+    retrieval_mode: str
+    index_version: str
+    added: float
+
+class RecentTickets:
+    """Rolling index of recently answered tickets' embeddings (per worker process).
+
+    Entries expire after window_s and the oldest go first beyond max_tickets.
+    Only originals are added, so a duplicate always links to the first ticket
+    of its wave. Small enough for an exact inner-product search on the event loop.
+    """
+
+    def __init__(self, min_similarity: float = DEDUP_MIN_SIMILARITY, window_s: float = DEDUP_WINDOW_S,
+                 max_tickets: int = DEDUP_MAX_TICKETS):
+        self.min_similarity = min_similarity
+        self.window_s = window_s
+        self.max_tickets = max_tickets
+        self.index = None
+        self._entries: "OrderedDict[int, RecentTicket]" = OrderedDict()  # faiss id -> entry, oldest first
+        self._next_id = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _evict(self, room: int = 0):
+        cutoff = time.monotonic() - self.window_s
+        expired = []
+        while self._entries:
+            fid, entry = next(iter(self._entries.items()))
+            if entry.added >= cutoff and len(self._entries) + room <= self.max_tickets:
+                break
+            self._entries.popitem(last=False)
+            expired.append(fid)
+        if expired:
+            self.index.remove_ids(np.asarray(expired, dtype=np.int64))
+        DEDUP_INDEX_SIZE.set(len(self._entries))
+
+    def match(self, emb: np.ndarray, retrieval_mode: str, index_version: str) -> Optional[Tuple[RecentTicket, float]]:
+        """The most similar recent ticket above min_similarity, answered by the same retrieval mode and
+        index snapshot, or None."""
+        if self.index is None:
+            return None
+        self._evict()
+        hit = None
+        if self._entries:
+            k = min(4, len(self._entries))
+            sims, ids = self.index.search(np.asarray(emb, dtype=np.float32).reshape(1, -1), k)
+            for sim, fid in zip(sims[0], ids[0]):
+                if fid < 0 or sim < self.min_similarity:
+                    break
+                entry = self._entries[int(fid)]
+                if entry.retrieval_mode == retrieval_mode and entry.index_version == index_version:
+                    hit = (entry, float(sim))
+                    break
+        DEDUP_CHECKS.labels(outcome="duplicate" if hit else "new").inc()
+        return hit
+
+    def add(self, emb: np.ndarray, entry: RecentTicket):
+        emb = np.asarray(emb, dtype=np.float32).reshape(1, -1)
+        if self.index is None:
+            self.index = faiss.IndexIDMap2(faiss.IndexFlatIP(emb.shape[1]))
+        self._evict(room=1)
+        fid = self._next_id
+        self._next_id += 1
+        self.index.add_with_ids(emb, np.asarray([fid], dtype=np.int64))
+        self._entries[fid] = entry
+        DEDUP_INDEX_SIZE.set(len(self._entries))
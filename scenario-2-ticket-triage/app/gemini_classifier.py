@@ -1,12 +1,24 @@
 import os
 import json
+import asyncio
 import logging
+import threading
+from typing import Dict, List, Optional, Tuple
+from contextlib import asynccontextmanager
 import google.generativeai as genai
 from tenacity import retry, stop_after_attempt, wait_exponential_jitter, retry_if_exception_type
-from .metrics import GEMINI_CALLS, GEMINI_RETRIES, EST_TOKENS
+from . import gemini_stub
+from .tracing import span
+from .metrics import GEMINI_CALLS, GEMINI_RETRIES, EST_TOKENS, GEMINI_IN_FLIGHT, GEMINI_QUEUED, GEMINI_BATCH_FALLBACKS
 
 log = logging.getLogger("triage.gemini")
 
+# Max concurrent Gemini calls per worker; extra callers wait on the semaphore.
+GEMINI_MAX_IN_FLIGHT = int(os.getenv("GEMINI_MAX_IN_FLIGHT", "32"))
+GEMINI_TIMEOUT_S = float(os.getenv("GEMINI_TIMEOUT_S", "20"))
+
+_semaphore = asyncio.Semaphore(GEMINI_MAX_IN_FLIGHT)
+
 ALLOWED_PRODUCT = {"CASB", "SWG", "ZTNA", "OTHER"}
 ALLOWED_URGENCY = {"P0", "P1", "P2", "P3"}
 
@@ -33,33 +45,131 @@ Respond ONLY in valid JSON:
 }}
 """
 
+# Same instructions as CLASSIFICATION_PROMPT, sent once for a whole pack of tickets.
+BATCH_CLASSIFICATION_PROMPT = """You are a support ticket classifier.
+
+Classify EACH of the following tickets into:
+- product_area: one of [CASB, SWG, ZTNA, OTHER]
+- urgency: one of [P0, P1, P2, P3]
+
+Definitions:
+P0: Service down, security incident, customer blocked
+P1: Major functionality broken, workaround exists
+P2: Partial issue, degraded experience
+P3: How-to, informational, documentation request
+
+Tickets (JSON array of objects with "id" and "text"):
+{tickets_json}
+
+Respond ONLY with a valid JSON array containing exactly one object per ticket:
+[
+  {{
+    "id": <ticket id>,
+    "product_area": "...",
+    "urgency": "...",
+    "reason": "short explanation"
+  }}
+]
+"""
+
+# Packing bounds for batch classification (estimated input tokens per prompt).
+GEMINI_BATCH_MAX_TICKETS = int(os.getenv("GEMINI_BATCH_MAX_TICKETS", "25"))
+GEMINI_BATCH_MAX_TOKENS = int(os.getenv("GEMINI_BATCH_MAX_TOKENS", "8000"))
+
+FALLBACK_PREFIX = "fallback:"
+
 class GeminiError(RuntimeError):
     pass
 
+def current_model_name() -> str:
+    if gemini_stub.enabled():
+        return gemini_stub.STUB_MODEL_NAME
+    return os.getenv("GEMINI_MODEL", "gemini-1.5-flash")
+
 def _estimate_tokens(text: str) -> int:
     # rough estimate: ~4 chars per token (heuristic)
     return max(1, int(len(text) / 4))
 
+# Process-wide client: (api_key, model_name, model). Rebuilt only when either changes.
+_model_cache = None
+_model_lock = threading.Lock()
+
 def _init_model():
+    global _model_cache
+    if gemini_stub.enabled():
+        # GEMINI_STUB=1: local deterministic model (see gemini_stub.py), no API key needed
+        if _model_cache is None or _model_cache[1] != gemini_stub.STUB_MODEL_NAME:
+            with _model_lock:
+                _model_cache = (None, gemini_stub.STUB_MODEL_NAME, gemini_stub.StubModel())
+        return _model_cache[2], gemini_stub.STUB_MODEL_NAME
     api_key = os.getenv("GEMINI_API_KEY", "")
     if not api_key:
         raise GeminiError("GEMINI_API_KEY not set")
-    genai.configure(api_key=api_key)
-    model_name = os.getenv("GEMINI_MODEL", "gemini-1.5-flash")
-    return genai.GenerativeModel(
-        model_name=model_name,
-        generation_config={
-            "temperature": 0,
-            "response_mime_type": "application/json",
-        },
-    ), model_name
-
-@retry(
+    model_name = current_model_name()
+
+    cached = _model_cache
+    if cached is not None and cached[0] == api_key and cached[1] == model_name:
+        return cached[2], model_name
+
+    with _model_lock:
+        cached = _model_cache
+        if cached is not None and cached[0] == api_key and cached[1] == model_name:
+            return cached[2], model_name
+        genai.configure(api_key=api_key)
+        model = genai.GenerativeModel(
+            model_name=model_name,
+            generation_config={
+                "temperature": 0,
+                "response_mime_type": "application/json",
+            },
+        )
+        _model_cache = (api_key, model_name, model)
+        log.info("Gemini client initialised", extra={"operation": "gemini_init"})
+    return model, model_name
+
+async def warm_up():
+    """Build the shared client and open its connection before the first ticket arrives."""
+    try:
+        model, _ = _init_model()
+        await asyncio.wait_for(model.count_tokens_async("warm-up"), timeout=GEMINI_TIMEOUT_S)
+        log.info("Gemini client warmed up", extra={"operation": "gemini_warmup"})
+    except Exception as e:
+        # never block startup on the classifier; the first request will retry
+        log.warning(f"Gemini warm-up failed: {e}", extra={"operation": "gemini_warmup"})
+
+_retry_policy = retry(
     reraise=True,
     stop=stop_after_attempt(3),
     wait=wait_exponential_jitter(initial=0.5, max=4.0),
     retry=retry_if_exception_type((GeminiError, TimeoutError, ConnectionError)),
 )
+
+def _parse_response(text: str, model_name: str) -> dict:
+    with span("gemini.parse"):
+        return _parse_response_text(text, model_name)
+
+def _parse_response_text(text: str, model_name: str) -> dict:
+    EST_TOKENS.labels(model=model_name, kind="output").inc(_estimate_tokens(text))
+
+    try:
+        data = json.loads(text)
+    except Exception:
+        GEMINI_CALLS.labels(status="parse_error").inc()
+        return {"product_area": "OTHER", "urgency": "P2", "reason": f"{FALLBACK_PREFIX} invalid JSON", "model": model_name}
+
+    product = str(data.get("product_area", "OTHER")).upper().strip()
+    urgency = str(data.get("urgency", "P2")).upper().strip()
+    reason = str(data.get("reason", "")).strip()
+
+    if product not in ALLOWED_PRODUCT:
+        product = "OTHER"
+    if urgency not in ALLOWED_URGENCY:
+        urgency = "P2"
+
+    GEMINI_CALLS.labels(status="ok").inc()
+    return {"product_area": product, "urgency": urgency, "reason": reason, "model": model_name}
+
+@_retry_policy
 def classify_with_gemini(ticket_text: str) -> dict:
     model, model_name = _init_model()
     prompt = CLASSIFICATION_PROMPT.format(ticket_text=ticket_text)
@@ -68,28 +178,145 @@ def classify_with_gemini(ticket_text: str) -> dict:
     EST_TOKENS.labels(model=model_name, kind="input").inc(_estimate_tokens(prompt))
 
     try:
-        resp = model.generate_content(prompt)
+        with span("gemini.call"):
+            resp = model.generate_content(prompt)
     except Exception as e:
         GEMINI_RETRIES.inc()
         raise GeminiError(str(e))
 
-    text = getattr(resp, "text", "") or ""
+    return _parse_response(getattr(resp, "text", "") or "", model_name)
+
+@asynccontextmanager
+async def _gemini_slot():
+    # queued = waiting for the semaphore, in_flight = holding it
+    GEMINI_QUEUED.inc()
+    try:
+        await _semaphore.acquire()
+    finally:
+        GEMINI_QUEUED.dec()
+    GEMINI_IN_FLIGHT.inc()
+    try:
+        yield
+    finally:
+        GEMINI_IN_FLIGHT.dec()
+        _semaphore.release()
+
+@_retry_policy
+async def classify_with_gemini_async(ticket_text: str) -> dict:
+    """Event-loop friendly variant of classify_with_gemini.
+
+    Bounded by GEMINI_MAX_IN_FLIGHT; retries back off with asyncio.sleep.
+    """
+    model, model_name = _init_model()
+    prompt = CLASSIFICATION_PROMPT.format(ticket_text=ticket_text)
+
+    EST_TOKENS.labels(model=model_name, kind="input").inc(_estimate_tokens(prompt))
+
+    return _parse_response(await _generate_async(model, prompt), model_name)
+
+async def _generate_async(model, prompt: str) -> str:
+    async with _gemini_slot():
+        try:
+            with span("gemini.call"):
+                resp = await asyncio.wait_for(
+                    model.generate_content_async(prompt, request_options={"timeout": GEMINI_TIMEOUT_S}),
+                    timeout=GEMINI_TIMEOUT_S,
+                )
+        except asyncio.TimeoutError:
+            GEMINI_RETRIES.inc()
+            raise GeminiError(f"timed out after {GEMINI_TIMEOUT_S}s")
+        except Exception as e:
+            GEMINI_RETRIES.inc()
+            raise GeminiError(str(e))
+    return getattr(resp, "text", "") or ""
+
+def pack_batches(texts: List[str]) -> List[List[int]]:
+    """Greedily group ticket indices so each prompt stays within the ticket and token bounds."""
+    overhead = _estimate_tokens(BATCH_CLASSIFICATION_PROMPT)
+    groups, current, budget = [], [], overhead
+    for i, text in enumerate(texts):
+        # + id/quoting/separator overhead per ticket
+        cost = _estimate_tokens(text) + 8
+        if current and (len(current) >= GEMINI_BATCH_MAX_TICKETS or budget + cost > GEMINI_BATCH_MAX_TOKENS):
+            groups.append(current)
+            current, budget = [], overhead
+        current.append(i)
+        budget += cost
+    if current:
+        groups.append(current)
+    return groups
+
+@_retry_policy
+async def _classify_pack(items: List[Tuple[int, str]]) -> Dict[int, dict]:
+    model, model_name = _init_model()
+    tickets_json = json.dumps([{"id": i, "text": t} for i, t in items], ensure_ascii=False)
+    prompt = BATCH_CLASSIFICATION_PROMPT.format(tickets_json=tickets_json)
+
+    EST_TOKENS.labels(model=model_name, kind="input").inc(_estimate_tokens(prompt))
+    text = await _generate_async(model, prompt)
     EST_TOKENS.labels(model=model_name, kind="output").inc(_estimate_tokens(text))
+    with span("gemini.parse", tickets=len(items)):
+        return _parse_pack(text, items, model_name)
 
+def _parse_pack(text: str, items: List[Tuple[int, str]], model_name: str) -> Dict[int, dict]:
     try:
         data = json.loads(text)
     except Exception:
         GEMINI_CALLS.labels(status="parse_error").inc()
-        return {"product_area": "OTHER", "urgency": "P2", "reason": "fallback: invalid JSON", "model": model_name}
-
-    product = str(data.get("product_area", "OTHER")).upper().strip()
-    urgency = str(data.get("urgency", "P2")).upper().strip()
-    reason = str(data.get("reason", "")).strip()
+        return {}
+    if not isinstance(data, list):
+        GEMINI_CALLS.labels(status="parse_error").inc()
+        return {}
 
-    if product not in ALLOWED_PRODUCT:
-        product = "OTHER"
-    if urgency not in ALLOWED_URGENCY:
-        urgency = "P2"
+    # Unlike the single-ticket path we don't coerce unknown labels: an invalid
+    # entry is dropped and that ticket is re-classified on its own.
+    expected = {i for i, _ in items}
+    out = {}
+    for obj in data:
+        if not isinstance(obj, dict):
+            continue
+        try:
+            i = int(obj.get("id"))
+        except (TypeError, ValueError):
+            continue
+        product = str(obj.get("product_area", "")).upper().strip()
+        urgency = str(obj.get("urgency", "")).upper().strip()
+        if i not in expected or product not in ALLOWED_PRODUCT or urgency not in ALLOWED_URGENCY:
+            continue
+        out[i] = {
+            "product_area": product,
+            "urgency": urgency,
+            "reason": str(obj.get("reason", "")).strip(),
+            "model": model_name,
+        }
 
     GEMINI_CALLS.labels(status="ok").inc()
-    return {"product_area": product, "urgency": urgency, "reason": reason, "model": model_name}
+    return out
+
+async def classify_batch_with_gemini_async(texts: List[str]) -> List[dict]:
+    """Classify many tickets with one Gemini request per pack (see pack_batches).
+
+    Tickets missing or invalid in a pack's response fall back to
+    classify_with_gemini_async individually. Raises GeminiError only if a
+    fallback call fails.
+    """
+    results: List[Optional[dict]] = [None] * len(texts)
+    groups = pack_batches(texts)
+    packed = await asyncio.gather(
+        *[_classify_pack([(i, texts[i]) for i in g]) for g in groups],
+        return_exceptions=True,
+    )
+    for group, res in zip(groups, packed):
+        if isinstance(res, BaseException):
+            log.warning(f"batch classification failed for {len(group)} tickets: {res}", extra={"operation": "gemini_batch"})
+            continue
+        for i in group:
+            results[i] = res.get(i)
+
+    missing = [i for i, r in enumerate(results) if r is None]
+    if missing:
+        GEMINI_BATCH_FALLBACKS.inc(len(missing))
+        fallbacks = await asyncio.gather(*[classify_with_gemini_async(texts[i]) for i in missing])
+        for i, r in zip(missing, fallbacks):
+            results[i] = r
+    return results
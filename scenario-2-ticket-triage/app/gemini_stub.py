@@ -0,0 +1,84 @@
+"""Deterministic local stand-in for the Gemini model, for load tests and offline runs.
+
+Enabled with GEMINI_STUB=1 (no API key needed). Classifies by keyword rules,
+sleeps GEMINI_STUB_LATENCY_MS (+/- GEMINI_STUB_JITTER_MS) per call and fails a
+GEMINI_STUB_FAILURE_RATE fraction of calls. Jitter and failures come from a
+seeded RNG (GEMINI_STUB_SEED), so a run with the same request order repeats exactly.
+"""
+import os
+import re
+import json
+import time
+import random
+import asyncio
+import threading
+
+STUB_MODEL_NAME = "gemini-stub"
+
+_AREA_RULES = [
+    ("CASB", re.compile(r"casb|salesforce|saas|api connector|sanctioned", re.I)),
+    ("ZTNA", re.compile(r"ztna|private access|posture|publisher|internal app", re.I)),
+    ("SWG", re.compile(r"swg|proxy|ssl|web|certificate|url", re.I)),
+]
+_URGENCY_RULES = [
+    ("P0", re.compile(r"outage|down|breach|urgent|all users|cannot", re.I)),
+    ("P1", re.compile(r"denied|failing|broken|unreachable|intermittent", re.I)),
+    ("P3", re.compile(r"how do i|how to|understand|documentation|configure", re.I)),
+]
+
+# ticket text(s) inside CLASSIFICATION_PROMPT / BATCH_CLASSIFICATION_PROMPT
+_SINGLE = re.compile(r'Ticket:\n"(.*)"\n\nRespond', re.S)
+_BATCH = re.compile(r"Tickets \(JSON array[^\n]*\n(.*)\n\nRespond", re.S)
+
+def enabled() -> bool:
+    return os.getenv("GEMINI_STUB", "0") == "1"
+
+def classify_text(text: str) -> dict:
+    area = next((a for a, rx in _AREA_RULES if rx.search(text)), "OTHER")
+    urgency = next((u for u, rx in _URGENCY_RULES if rx.search(text)), "P2")
+    return {"product_area": area, "urgency": urgency, "reason": "stub: keyword rules"}
+
+class _Response:
+    def __init__(self, text: str):
+        self.text = text
+
+class StubModel:
+    """Implements the parts of genai.GenerativeModel the classifier uses."""
+
+    def __init__(self):
+        self.latency_s = float(os.getenv("GEMINI_STUB_LATENCY_MS", "200")) / 1000.0
+        self.jitter_s = float(os.getenv("GEMINI_STUB_JITTER_MS", "50")) / 1000.0
+        self.failure_rate = float(os.getenv("GEMINI_STUB_FAILURE_RATE", "0"))
+        self._rng = random.Random(int(os.getenv("GEMINI_STUB_SEED", "0")))
+        self._lock = threading.Lock()
+
+    def _draw(self):
+        with self._lock:
+            delay = max(0.0, self.latency_s + self._rng.uniform(-self.jitter_s, self.jitter_s))
+            fail = self._rng.random() < self.failure_rate
+        return delay, fail
+
+    def _answer(self, prompt: str) -> str:
+        m = _BATCH.search(prompt)
+        if m:
+            tickets = json.loads(m.group(1))
+            return json.dumps([{"id": t["id"], **classify_text(t["text"])} for t in tickets])
+        m = _SINGLE.search(prompt)
+        return json.dumps(classify_text(m.group(1) if m else prompt))
+
+    async def generate_content_async(self, prompt: str, request_options=None) -> _Response:
+        delay, fail = self._draw()
+        await asyncio.sleep(delay)
+        if fail:
+            raise ConnectionError("stub: injected failure")
+        return _Response(self._answer(prompt))
+
+    def generate_content(self, prompt: str, request_options=None) -> _Response:
+        delay, fail = self._draw()
+        time.sleep(delay)
+        if fail:
+            raise ConnectionError("stub: injected failure")
+        return _Response(self._answer(prompt))
+
+    async def count_tokens_async(self, contents):
+        return {"total_tokens": max(1, len(str(contents)) // 4)}
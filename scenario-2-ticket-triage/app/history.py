@@ -0,0 +1,52 @@
+import base64
+from datetime import datetime
+from typing import List, Optional, Tuple
+from sqlalchemy import select, tuple_
+
+from .db import SessionLocal
+from .models import Ticket
+
+TICKETS_PAGE_MAX = 500
+
+def encode_cursor(created_at: datetime, ticket_id: int) -> str:
+    raw = f"{created_at.isoformat()}|{ticket_id}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Raises ValueError for anything encode_cursor didn't produce."""
+    try:
+        created_at, ticket_id = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").split("|")
+        return datetime.fromisoformat(created_at), int(ticket_id)
+    except (UnicodeError, TypeError, ValueError) as e:
+        raise ValueError(f"invalid cursor: {cursor!r}") from e
+
+async def ticket_page(limit: int, cursor: Optional[str] = None, product_area: Optional[str] = None,
+                      urgency: Optional[str] = None, external_id: Optional[str] = None) -> Tuple[List, Optional[str]]:
+    """(rows, next cursor): tickets newest first, by keyset on (created_at, id).
+
+    Each page is an index range scan starting at the cursor (ix_tickets_*_created_id),
+    so page N costs the same as page 1, and rows inserted meanwhile never shift a page.
+    """
+    stmt = select(
+        Ticket.id, Ticket.external_id, Ticket.text, Ticket.product_area, Ticket.urgency,
+        Ticket.classifier_model, Ticket.duplicate_of, Ticket.created_at,
+    )
+    if product_area is not None:
+        stmt = stmt.where(Ticket.product_area == product_area)
+    if urgency is not None:
+        stmt = stmt.where(Ticket.urgency == urgency)
+    if external_id is not None:
+        stmt = stmt.where(Ticket.external_id == external_id)
+    if cursor is not None:
+        created_at, ticket_id = decode_cursor(cursor)
+        stmt = stmt.where(tuple_(Ticket.created_at, Ticket.id) < tuple_(created_at, ticket_id))
+    limit = max(1, min(limit, TICKETS_PAGE_MAX))
+    # one extra row tells whether there is a next page
+    stmt = stmt.order_by(Ticket.created_at.desc(), Ticket.id.desc()).limit(limit + 1)
+
+    async with SessionLocal() as session:
+        rows = (await session.execute(stmt)).all()
+    if len(rows) <= limit:
+        return rows, None
+    last = rows[limit - 1]
+    return rows[:limit], encode_cursor(last.created_at, last.id)
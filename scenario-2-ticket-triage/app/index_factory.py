@@ -0,0 +1,111 @@
+import os
+import math
+import logging
+import numpy as np
+import faiss
+
+log = logging.getLogger("triage.vector")
+
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw")
+
+# faiss warns below ~39 training points per IVF centroid
+_MIN_POINTS_PER_CENTROID = 39
+
+def index_params_from_env() -> dict:
+    return {
+        "type": os.getenv("VECTOR_INDEX_TYPE", "flat").lower(),
+        "nlist": int(os.getenv("VECTOR_IVF_NLIST", "0")),  # 0 = ~4*sqrt(n)
+        "nprobe": int(os.getenv("VECTOR_IVF_NPROBE", "8")),
+        "pq_m": int(os.getenv("VECTOR_PQ_M", "16")),
+        "pq_nbits": int(os.getenv("VECTOR_PQ_NBITS", "8")),
+        "hnsw_m": int(os.getenv("VECTOR_HNSW_M", "32")),
+        "ef_construction": int(os.getenv("VECTOR_HNSW_EF_CONSTRUCTION", "200")),
+        "ef_search": int(os.getenv("VECTOR_HNSW_EF_SEARCH", "64")),
+    }
+
+def search_overrides_from_env() -> dict:
+    """Search-time knobs can be retuned at load time without rebuilding."""
+    out = {}
+    if os.getenv("VECTOR_IVF_NPROBE"):
+        out["nprobe"] = int(os.environ["VECTOR_IVF_NPROBE"])
+    if os.getenv("VECTOR_HNSW_EF_SEARCH"):
+        out["ef_search"] = int(os.environ["VECTOR_HNSW_EF_SEARCH"])
+    return out
+
+def _auto_nlist(n: int, requested: int) -> int:
+    nlist = requested or int(4 * math.sqrt(n))
+    return max(1, min(nlist, n // _MIN_POINTS_PER_CENTROID))
+
+def build_index(embs: np.ndarray, params: dict):
+    """Build and train an inner-product index over normalized embeddings.
+
+    Returns (index, effective_params). Small corpora that can't train the
+    requested IVF/PQ layout fall back to flat, and the returned params say so.
+    """
+    params = dict(params)
+    kind = params.get("type", "flat")
+    if kind not in INDEX_TYPES:
+        raise ValueError(f"unknown index type {kind!r}; expected one of {INDEX_TYPES}")
+    n, dim = embs.shape
+
+    if kind in ("ivf_flat", "ivf_pq"):
+        nlist = _auto_nlist(n, params.get("nlist", 0))
+        min_train = max(nlist * _MIN_POINTS_PER_CENTROID, 2 ** params["pq_nbits"] if kind == "ivf_pq" else 0)
+        if n < min_train or (kind == "ivf_pq" and dim % params["pq_m"]):
+            log.warning(f"{kind} not trainable on {n} vectors; using flat", extra={"operation": "vector_build"})
+            kind = "flat"
+        else:
+            params["nlist"] = nlist
+
+    if kind == "flat":
+        index = faiss.IndexFlatIP(dim)
+    elif kind == "ivf_flat":
+        quantizer = faiss.IndexFlatIP(dim)
+        index = faiss.IndexIVFFlat(quantizer, dim, params["nlist"], faiss.METRIC_INNER_PRODUCT)
+    elif kind == "ivf_pq":
+        quantizer = faiss.IndexFlatIP(dim)
+        index = faiss.IndexIVFPQ(
+            quantizer, dim, params["nlist"], params["pq_m"], params["pq_nbits"], faiss.METRIC_INNER_PRODUCT
+        )
+    else:
+        index = faiss.IndexHNSWFlat(dim, params["hnsw_m"], faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = params["ef_construction"]
+
+    if not index.is_trained:
+        index.train(embs)
+    params["type"] = kind
+    apply_search_params(index, params)
+    return index, params
+
+def with_ids(index):
+    """Make index accept add_with_ids/remove_ids with caller-chosen int64 ids.
+
+    IVF indexes store ids natively; flat and HNSW need an IndexIDMap2 wrapper.
+    """
+    if isinstance(faiss.downcast_index(index), faiss.IndexIVF):
+        return index
+    return faiss.IndexIDMap2(index)
+
+def _unwrap(index):
+    index = faiss.downcast_index(index)
+    # id-map wrappers keep the real index in .index
+    while isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        index = faiss.downcast_index(index.index)
+    return index
+
+def apply_search_params(index, params: dict):
+    inner = _unwrap(index)
+    if isinstance(inner, faiss.IndexIVF):
+        inner.nprobe = params.get("nprobe", 8)
+    elif isinstance(inner, faiss.IndexHNSW):
+        inner.hnsw.efSearch = params.get("ef_search", 64)
+
+def search_params(index, sel=None):
+    """SearchParameters carrying an id selector. faiss takes nprobe/efSearch from the
+    parameters object when one is passed, so copy the index's current values in."""
+    inner = _unwrap(index)
+    if isinstance(inner, faiss.IndexIVF):
+        return faiss.SearchParametersIVF(sel=sel, nprobe=inner.nprobe)
+    if isinstance(inner, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(sel=sel, efSearch=inner.hnsw.efSearch)
+    return faiss.SearchParameters(sel=sel)
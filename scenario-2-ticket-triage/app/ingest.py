@@ -1,15 +1,32 @@
 
 import json
 import os
-from app.vector_store import VectorStore, DocChunk
-import numpy as np, faiss
+import time
+import argparse
+from itertools import islice
+import numpy as np
+import faiss
+from app.vector_store import VectorStore, DocChunk, chunk_hash
+from app.chunk_store import ChunkStore, ChunkStoreWriter
+from app.index_factory import build_index, with_ids
+from app.partitions import build_partitions
+from app import snapshots
 
-CRAWLED_FILE = "data/crawled_docs/netskope_docs.json"
-VECTOR_STORE_DIR = "data/vector_store"
+CRAWLED_FILE = "data/crawled_docs/netskope_docs.jsonl"
+VECTOR_STORE_DIR = os.getenv("VECTOR_STORE_DIR", "data/vector_store")
 
 CHUNK_SIZE = 800
 OVERLAP = 150
 
+# Peak memory is bounded by these, not by corpus size.
+BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "256"))
+CHECKPOINT_EVERY = int(os.getenv("INGEST_CHECKPOINT_EVERY", "20"))  # batches; 0 disables
+# Vectors buffered to train IVF centroids when building a fresh IVF index.
+TRAIN_SIZE = int(os.getenv("INGEST_TRAIN_SIZE", "50000"))
+
+CKPT_STATE = "ingest.ckpt.json"
+CKPT_INDEX = "faiss.index.ckpt"
+
 def chunk_text(text: str, chunk_size: int, overlap: int):
     start = 0
     n = len(text)
@@ -20,37 +37,268 @@ def chunk_text(text: str, chunk_size: int, overlap: int):
             break
         start = max(0, end - overlap)
 
-def ingest():
-    with open(CRAWLED_FILE, "r", encoding="utf-8") as f:
-        pages = json.load(f)
+def _iter_json_array(f, bufsize: int = 1 << 16):
+    # incremental decode so a legacy JSON crawl file is never loaded whole
+    decoder = json.JSONDecoder()
+    buf = f.read(bufsize).lstrip()
+    if not buf.startswith("["):
+        raise ValueError("expected a JSON array")
+    buf = buf[1:]
+    eof = False
+    while True:
+        buf = buf.lstrip().lstrip(",").lstrip()
+        if buf.startswith("]"):
+            return
+        if buf:
+            try:
+                obj, end = decoder.raw_decode(buf)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            else:
+                yield obj
+                buf = buf[end:]
+                continue
+        more = f.read(bufsize)
+        if not more:
+            if eof or not buf:
+                raise ValueError("unterminated JSON array")
+            eof = True
+        buf += more
 
-    vs = VectorStore(store_dir=VECTOR_STORE_DIR)
+def iter_pages(path: str):
+    """Pages from the crawler's JSONL output (or a legacy JSON array), one at a time."""
+    with open(path, "r", encoding="utf-8") as f:
+        if path.endswith(".jsonl"):
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from _iter_json_array(f)
 
-    chunks = []
+def iter_chunks(pages):
     for page in pages:
         for i, chunk in enumerate(chunk_text(page["text"], CHUNK_SIZE, OVERLAP)):
-            chunks.append(
-                DocChunk(
-                    doc_id=f"{page['url']}#chunk{i}",
-                    text=f"{page['title']}\n{chunk}"
-                )
-            )
+            text = f"{page['title']}\n{chunk}"
+            yield DocChunk(doc_id=f"{page['url']}#chunk{i}", text=text, content_hash=chunk_hash(text))
+
+def _batched(it, n: int):
+    it = iter(it)
+    while True:
+        batch = list(islice(it, n))
+        if not batch:
+            return
+        yield batch
+
+class Embedder:
+    """Normalized float32 embeddings; workers > 1 tokenizes and encodes across processes."""
+
+    def __init__(self, model, workers: int = 0):
+        self.model = model
+        self.pool = model.start_multi_process_pool(["cpu"] * workers) if workers > 1 else None
+
+    def encode(self, texts):
+        if self.pool is not None:
+            embs = np.asarray(self.model.encode_multi_process(texts, self.pool), dtype=np.float32)
+            faiss.normalize_L2(embs)
+            return embs
+        return np.asarray(self.model.encode(texts, normalize_embeddings=True), dtype=np.float32)
+
+    def close(self):
+        if self.pool is not None:
+            self.model.stop_multi_process_pool(self.pool)
+
+def _source_fingerprint(path: str) -> dict:
+    st = os.stat(path)
+    return {"source": os.path.abspath(path), "size": st.st_size, "mtime": st.st_mtime}
+
+def _load_checkpoint(store_dir: str, source: dict):
+    state_path = os.path.join(store_dir, CKPT_STATE)
+    if not os.path.exists(state_path):
+        return None
+    with open(state_path, "r", encoding="utf-8") as f:
+        state = json.load(f)
+    if state.get("fingerprint") != source:
+        print("Crawl file or base snapshot changed since the checkpoint; starting over")
+        return None
+    index = faiss.read_index(os.path.join(store_dir, CKPT_INDEX))
+    if index.ntotal != state["index_ntotal"]:
+        # crashed between writing the index and the state file
+        print("Checkpoint is inconsistent; starting over")
+        return None
+    state["index"] = index
+    return state
+
+def _save_checkpoint(store_dir: str, vs: VectorStore, writer: ChunkStoreWriter, state: dict):
+    path = os.path.join(store_dir, CKPT_INDEX)
+    faiss.write_index(vs.index, path + ".tmp")
+    os.replace(path + ".tmp", path)
+    writer.checkpoint()
+    state = {**state, "next_id": vs.next_id, "index_ntotal": vs.index.ntotal, "index_params": vs.index_params}
+    path = os.path.join(store_dir, CKPT_STATE)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(path + ".tmp", path)
+
+def _clear_checkpoint(store_dir: str):
+    for name in (CKPT_STATE, CKPT_INDEX):
+        path = os.path.join(store_dir, name)
+        if os.path.exists(path):
+            os.remove(path)
+
+def _build_from_buffer(vs: VectorStore, train_buf: list):
+    all_ids = np.concatenate([i for i, _ in train_buf])
+    all_embs = np.vstack([e for _, e in train_buf])
+    train_buf.clear()
+    index, vs.index_params = build_index(all_embs, vs.index_params)
+    vs.index = with_ids(index)
+    vs.index.add_with_ids(all_embs, all_ids)
+
+def _add_vectors(vs: VectorStore, ids: np.ndarray, embs: np.ndarray, train_buf: list):
+    if vs.index is not None:
+        vs.index.add_with_ids(embs, ids)
+        return
+    # fresh build: IVF needs a training sample before anything can be added
+    train_buf.append((ids, embs))
+    buffered = sum(len(i) for i, _ in train_buf)
+    if not vs.index_params["type"].startswith("ivf") or buffered >= TRAIN_SIZE:
+        _build_from_buffer(vs, train_buf)
+
+def ingest(full: bool = False, batch_size: int = BATCH_SIZE, workers: int = 0, resume: bool = True) -> dict:
+    """Stream pages -> chunks -> batched embeddings into a new vector store snapshot.
+
+    Only new or changed chunks (by content hash) are embedded; unchanged
+    chunks keep their ids. Changed chunks get new ids and, like deleted
+    ones, their old ids are removed at the end in one pass. The live
+    snapshot is only read; the result is built in staging/ and published
+    as a new version (see snapshots), which running workers pick up.
+    Holds the snapshot build lock throughout, so runs never share staging/.
+    """
+    with snapshots.build_lock(VECTOR_STORE_DIR):
+        return _ingest(full, batch_size, workers, resume)
+
+def _ingest(full: bool, batch_size: int, workers: int, resume: bool) -> dict:
+    t0 = time.perf_counter()
+    base_version, base_dir = snapshots.resolve(VECTOR_STORE_DIR)
+    store_dir = snapshots.staging_dir(VECTOR_STORE_DIR)
+    vs = VectorStore(store_dir=base_dir)
+    old = {}
+    if not full and vs.load(mmap=False) and vs.next_id >= 0:
+        old = vs.chunks
+    else:
+        # nothing (usable) to diff against: build from scratch
+        vs.index, vs.next_id = None, 0
+    old_ids = vs.doc_ids if old else {}
+    vs.store_dir = store_dir
+
+    def old_hash(i):
+        return old.hash_of(i) if isinstance(old, ChunkStore) else old[i].content_hash
+
+    fingerprint = {**_source_fingerprint(CRAWLED_FILE), "base": base_version}
+    ckpt = _load_checkpoint(store_dir, fingerprint) if resume and not full else None
+    if ckpt:
+        try:
+            writer = ChunkStoreWriter(store_dir, resume_rows=ckpt["chunks_done"])
+        except ValueError as e:
+            print(f"Discarding checkpoint: {e}")
+            ckpt = None
+    if not ckpt:
+        # leftovers of an abandoned run
+        store_dir = snapshots.staging_dir(VECTOR_STORE_DIR, reset=True)
+        writer = ChunkStoreWriter(store_dir)
+
+    if ckpt:
+        vs.index, vs.next_id, vs.index_params = ckpt["index"], ckpt["next_id"], ckpt["index_params"]
+        stats, pending_removals, chunks_done = ckpt["stats"], ckpt["pending_removals"], ckpt["chunks_done"]
+        seen = set(writer.doc_ids())
+        print(f"Resuming after {chunks_done} chunks")
+    else:
+        stats = {"added": 0, "updated": 0, "removed": 0, "unchanged": 0}
+        pending_removals, chunks_done = [], 0
+        seen = set()
+    skipped = chunks_done
+
+    embedder = Embedder(vs.model, workers)
+    train_buf = []
+    embedded = 0
+    try:
+        stream = islice(iter_chunks(iter_pages(CRAWLED_FILE)), chunks_done, None)
+        for n_batch, batch in enumerate(_batched(stream, batch_size), start=1):
+            to_embed = []
+            for c in batch:
+                seen.add(c.doc_id)
+                old_id = old_ids.get(c.doc_id)
+                if old_id is not None and old_hash(old_id) == c.content_hash:
+                    stats["unchanged"] += 1
+                    writer.add(old_id, c)
+                    continue
+                if old_id is None:
+                    stats["added"] += 1
+                else:
+                    stats["updated"] += 1
+                    pending_removals.append(old_id)
+                to_embed.append((vs.next_id, c))
+                writer.add(vs.next_id, c)
+                vs.next_id += 1
 
-    vs.chunks = chunks
-    vs.build_from_dir = None  # safety
-    vs.index = None
+            if to_embed:
+                ids = np.array([i for i, _ in to_embed], dtype=np.int64)
+                _add_vectors(vs, ids, embedder.encode([c.text for _, c in to_embed]), train_buf)
+                embedded += len(to_embed)
+            chunks_done += len(batch)
 
-    embeddings = vs.model.encode([c.text for c in chunks], normalize_embeddings=True)
-    
-    embeddings = np.array(embeddings, dtype="float32")
+            if CHECKPOINT_EVERY and n_batch % CHECKPOINT_EVERY == 0 and vs.index is not None and not train_buf:
+                _save_checkpoint(store_dir, vs, writer, {
+                    "fingerprint": fingerprint,
+                    "chunks_done": chunks_done,
+                    "stats": stats,
+                    "pending_removals": pending_removals,
+                })
+                rate = (chunks_done - skipped) / (time.perf_counter() - t0)
+                print(f"  {chunks_done} chunks ({embedded} embedded), {rate:.0f} chunks/sec")
+        if train_buf:
+            _build_from_buffer(vs, train_buf)
+    finally:
+        embedder.close()
 
-    dim = embeddings.shape[1]
-    vs.index = faiss.IndexFlatIP(dim)
-    vs.index.add(embeddings)
+    removed = [i for doc_id, i in old_ids.items() if doc_id not in seen]
+    stats["removed"] = len(removed)
+    changed = stats["added"] or stats["updated"] or stats["removed"]
+    # stores that predate hybrid retrieval / partitions get them without re-embedding, as a new
+    # version: published snapshots are never modified
+    upgrade = vs.bm25 is None or vs.partitions is None
+    if vs.index is None or not (changed or upgrade):
+        writer.abort()
+        _clear_checkpoint(store_dir)
+        stats["version"] = base_version
+    else:
+        vs.remove_ids(removed + pending_removals)
+        writer.close()
+        vs.chunks = ChunkStore(store_dir)
+        vs.build_lexical()
+        vs.set_partitions(build_partitions(vs.chunks.items()))
+        vs.save(write_chunks=False)
+        _clear_checkpoint(store_dir)
+        stats["version"] = snapshots.publish(VECTOR_STORE_DIR, store_dir)
 
-    vs.save()
-    print(f"Ingested {len(chunks)} chunks into FAISS")
+    elapsed = time.perf_counter() - t0
+    stats["chunks"] = chunks_done
+    stats["chunks_per_sec"] = round((chunks_done - skipped) / elapsed, 1) if elapsed else 0.0
+    stats["embedded_per_sec"] = round(embedded / elapsed, 1) if elapsed else 0.0
+    return stats
 
 if __name__ == "__main__":
-    ingest()
+    ap = argparse.ArgumentParser(description="Chunk, embed and index crawled docs")
+    ap.add_argument("--full", action="store_true", help="rebuild from scratch instead of syncing changed chunks")
+    ap.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="chunks per embedding batch")
+    ap.add_argument("--workers", type=int, default=0, help="encode across N processes (0/1 = in-process)")
+    ap.add_argument("--no-resume", action="store_true", help="ignore an existing checkpoint")
+    args = ap.parse_args()
 
+    stats = ingest(full=args.full, batch_size=args.batch_size, workers=args.workers, resume=not args.no_resume)
+    print(
+        f"Ingested {stats['chunks']} chunks into FAISS: "
+        f"{stats['added']} added, {stats['updated']} updated, {stats['removed']} removed, "
+        f"{stats['unchanged']} unchanged ({stats['chunks_per_sec']} chunks/sec, "
+        f"{stats['embedded_per_sec']} embedded/sec); live version: {stats['version']}"
+    )
@@ -0,0 +1,173 @@
+import os
+import asyncio
+import logging
+from typing import List, Optional
+import numpy as np
+import faiss
+from sqlalchemy import select
+from sqlalchemy.exc import SQLAlchemyError
+
+from .db import SessionLocal
+from .models import Ticket
+from .gemini_classifier import FALLBACK_PREFIX
+from .tracing import span
+from .metrics import LOCAL_CLASSIFY, LOCAL_CLASSIFIER_EXAMPLES
+
+log = logging.getLogger("triage.local_classifier")
+
+# Tier 1 of the classification cascade: kNN over embeddings of past Gemini-labeled tickets.
+# Confident answers are returned locally; the rest escalate to Gemini. Off by default: it adds a
+# MiniLM encode to every cache miss and each worker reloads its examples from Postgres (see design.md).
+LOCAL_CLASSIFIER = os.getenv("LOCAL_CLASSIFIER", "0") == "1"
+LOCAL_CLASSIFIER_K = int(os.getenv("LOCAL_CLASSIFIER_K", "10"))
+# share of the (similarity-weighted) neighbour vote the winning label needs, for area and urgency each
+LOCAL_CLASSIFIER_MIN_CONFIDENCE = float(os.getenv("LOCAL_CLASSIFIER_MIN_CONFIDENCE", "0.8"))
+# cosine similarity of the nearest neighbour; below it the ticket is unlike anything seen
+LOCAL_CLASSIFIER_MIN_SIMILARITY = float(os.getenv("LOCAL_CLASSIFIER_MIN_SIMILARITY", "0.6"))
+LOCAL_CLASSIFIER_MIN_EXAMPLES = int(os.getenv("LOCAL_CLASSIFIER_MIN_EXAMPLES", "50"))
+LOCAL_CLASSIFIER_MAX_EXAMPLES = int(os.getenv("LOCAL_CLASSIFIER_MAX_EXAMPLES", "50000"))
+LOCAL_CLASSIFIER_REFRESH_S = float(os.getenv("LOCAL_CLASSIFIER_REFRESH_S", "300"))
+
+LOCAL_MODEL_NAME = "local-knn"
+# never learn from our own answers or from placeholders
+_UNTRUSTED_MODELS = (LOCAL_MODEL_NAME, "degraded")
+
+def _vote(labels: np.ndarray, weights: np.ndarray):
+    """(label, share of the total weight) for the heaviest label."""
+    totals = {}
+    for label, w in zip(labels, weights):
+        totals[label] = totals.get(label, 0.0) + w
+    best = max(totals, key=totals.get)
+    total = sum(totals.values())
+    return best, (totals[best] / total if total > 0 else 0.0)
+
+class LocalClassifier:
+    """Similarity-weighted kNN over labeled ticket embeddings, in an in-memory FAISS index.
+
+    The index is rebuilt from Postgres every LOCAL_CLASSIFIER_REFRESH_S and
+    swapped in whole, so queries never see a half-built one. Query embeddings
+    come from the VectorStore (same model as the stored Ticket.embedding, and
+    cached, so /respond's retrieval reuses them).
+    """
+
+    def __init__(self, k: int = LOCAL_CLASSIFIER_K):
+        self.k = k
+        self.store = None
+        # (index, product areas, urgencies)
+        self._state = None
+        self._task = None
+
+    @property
+    def size(self) -> int:
+        return self._state[0].ntotal if self._state is not None else 0
+
+    def attach(self, store):
+        self.store = store
+
+    def start(self):
+        # disabled: no periodic reload of the examples either
+        if LOCAL_CLASSIFIER and self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await self.refresh()
+            await asyncio.sleep(LOCAL_CLASSIFIER_REFRESH_S)
+
+    async def refresh(self):
+        stmt = (
+            select(Ticket.embedding, Ticket.product_area, Ticket.urgency)
+            .where(
+                Ticket.embedding.isnot(None),
+                Ticket.product_area.isnot(None),
+                Ticket.urgency.isnot(None),
+                # copies of another ticket's label would over-weight incident waves
+                Ticket.duplicate_of.is_(None),
+                Ticket.classifier_model.notin_(_UNTRUSTED_MODELS),
+                ~Ticket.classification_reason.startswith(FALLBACK_PREFIX),
+            )
+            .order_by(Ticket.id.desc())
+            .limit(LOCAL_CLASSIFIER_MAX_EXAMPLES)
+        )
+        try:
+            async with SessionLocal() as session:
+                rows = (await session.execute(stmt)).all()
+        except SQLAlchemyError as e:
+            log.warning(f"local classifier refresh failed: {e}", extra={"operation": "local_classifier"})
+            return
+        self._state = await asyncio.to_thread(self._build, rows)
+        LOCAL_CLASSIFIER_EXAMPLES.set(self.size)
+        log.info(f"local classifier refreshed with {self.size} examples", extra={"operation": "local_classifier"})
+
+    @staticmethod
+    def _build(rows):
+        embs = [np.frombuffer(e, dtype=np.float32) for e, _, _ in rows]
+        if not embs:
+            return None
+        dim = embs[0].shape[0]
+        # rows written under another embedding model have another width; skip them
+        keep = [i for i, e in enumerate(embs) if e.shape[0] == dim]
+        index = faiss.IndexFlatIP(dim)
+        index.add(np.vstack([embs[i] for i in keep]))
+        areas = np.array([rows[i][1] for i in keep], dtype=object)
+        urgencies = np.array([rows[i][2] for i in keep], dtype=object)
+        return index, areas, urgencies
+
+    def predict(self, embs: np.ndarray) -> List[Optional[dict]]:
+        """A classification per embedding, or None where the neighbours don't agree enough."""
+        state = self._state
+        if state is None or state[0].ntotal < LOCAL_CLASSIFIER_MIN_EXAMPLES:
+            return [None] * len(embs)
+        index, areas, urgencies = state
+        sims, idxs = index.search(np.asarray(embs, dtype=np.float32), min(self.k, index.ntotal))
+        out = []
+        for row_sims, row_idxs in zip(sims, idxs):
+            ok = row_idxs >= 0
+            row_sims, row_idxs = row_sims[ok], row_idxs[ok]
+            if not len(row_idxs) or row_sims[0] < LOCAL_CLASSIFIER_MIN_SIMILARITY:
+                out.append(None)
+                continue
+            weights = np.maximum(row_sims, 0.0)
+            area, area_conf = _vote(areas[row_idxs], weights)
+            urgency, urgency_conf = _vote(urgencies[row_idxs], weights)
+            if min(area_conf, urgency_conf) < LOCAL_CLASSIFIER_MIN_CONFIDENCE:
+                out.append(None)
+                continue
+            out.append({
+                "product_area": area,
+                "urgency": urgency,
+                "reason": f"{len(row_idxs)} similar past tickets (area {area_conf:.2f}, urgency {urgency_conf:.2f})",
+                "model": LOCAL_MODEL_NAME,
+            })
+        return out
+
+    async def classify_many(self, texts: List[str]) -> List[Optional[dict]]:
+        """Local answers for the confident texts; None marks the ones to escalate."""
+        if not LOCAL_CLASSIFIER or self.store is None:
+            return [None] * len(texts)
+        with span("classify.local", tickets=len(texts)):
+            # embed even while the index is too small: the cached embedding is stored on the
+            # ticket row, which is how the index gets its examples
+            embs = await self.store.aembed_many(texts)
+            if self.size < LOCAL_CLASSIFIER_MIN_EXAMPLES:
+                LOCAL_CLASSIFY.labels(outcome="unavailable").inc(len(texts))
+                return [None] * len(texts)
+            results = self.predict(embs)
+        answered = sum(1 for r in results if r is not None)
+        LOCAL_CLASSIFY.labels(outcome="local").inc(answered)
+        LOCAL_CLASSIFY.labels(outcome="escalated").inc(len(texts) - answered)
+        return results
+
+    async def classify(self, text: str) -> Optional[dict]:
+        return (await self.classify_many([text]))[0]
+
+knn = LocalClassifier()
@@ -0,0 +1,49 @@
+import re
+import time
+import threading
+from collections import OrderedDict
+from .metrics import CACHE_EVICTIONS
+
+_WS = re.compile(r"\s+")
+
+def normalize_text(text: str) -> str:
+    return _WS.sub(" ", text).strip().lower()
+
+class LRUTTLCache:
+    """Bounded LRU map whose entries also expire after ttl_s seconds.
+
+    Thread-safe: the vector store uses it from its query worker thread.
+    """
+
+    def __init__(self, maxsize: int, ttl_s: float, name: str):
+        self.maxsize = maxsize
+        self.ttl_s = ttl_s
+        self.name = name
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                CACHE_EVICTIONS.labels(cache=self.name, reason="ttl").inc()
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def put(self, key: str, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl_s, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                CACHE_EVICTIONS.labels(cache=self.name, reason="capacity").inc()
+
+    def __len__(self):
+        return len(self._data)
@@ -1,20 +1,39 @@
 import time
+_IMPORT_T0 = time.perf_counter()
+import math
 import uuid
+import asyncio
+import json
 import os
 import logging
+from datetime import datetime, timedelta
+from typing import List, Optional
 from fastapi import FastAPI, Request, HTTPException
-from fastapi.responses import Response
+from fastapi.responses import Response, StreamingResponse
 from prometheus_client import generate_latest, CONTENT_TYPE_LATEST
 from sqlalchemy import select
-from sqlalchemy.exc import SQLAlchemyError
 
 from .logging_setup import setup_logging
 from .db import engine, Base, SessionLocal
-from .models import Ticket, RetrievalLog, ResponseLog
-from .schemas import TicketRequest, ClassifyResponse, RespondResponse, Citation
-from .metrics import REQUEST_LATENCY, RETRIEVAL_LATENCY
-from .gemini_classifier import classify_with_gemini, GeminiError
-from .vector_store import VectorStore
+from .models import Ticket
+from . import persistence
+from .persistence import TicketRecord, PersistenceBackpressure, persist_ticket, persist_tickets
+from .schemas import (
+    TicketRequest, ClassifyResponse, RespondResponse, Citation, DuplicateTicket, TicketDuplicates,
+    TicketSummary, TicketPage, StatsResponse,
+)
+from . import history, rollups
+from .metrics import REQUEST_LATENCY, RETRIEVAL_LATENCY, STARTUP_SECONDS, INDEX_VERSION, INDEX_RELOADS
+from . import tracing, profiler, snapshots, migrations
+from .admission import AdmissionController, AdmissionRejected, AdmissionTooLarge
+from .tracing import traced
+from .gemini_classifier import (
+    GeminiError, FALLBACK_PREFIX, current_model_name, pack_batches, warm_up as warm_up_classifier,
+)
+from .local_classifier import knn
+from .classification_cache import classify_cached, classify_batch_cached, degraded_classification, cache_key as classification_key
+from .vector_store import VectorStore, RETRIEVAL_MODE
+from .dedup import DEDUP_ENABLED, RecentTicket, RecentTickets
 from .rag import build_rag_answer
 
 setup_logging()
@@ -24,27 +43,172 @@ app = FastAPI(title="Ticket Triage Service (Scenario II)")
 
 VECTOR_STORE_DIR = os.getenv("VECTOR_STORE_DIR", "data/vector_store")
 DOCS_DIR = os.getenv("DOCS_DIR", "data/docs")
+CLASSIFY_BATCH_MAX_ITEMS = int(os.getenv("CLASSIFY_BATCH_MAX_ITEMS", "500"))
+# Retrieval-first: /respond returns citations with a degraded classification instead of a 503
+# when the classifier fails or takes longer than RESPOND_CLASSIFY_TIMEOUT_S.
+RESPOND_RETRIEVAL_FIRST = os.getenv("RESPOND_RETRIEVAL_FIRST", "0") == "1"
+RESPOND_CLASSIFY_TIMEOUT_S = float(os.getenv("RESPOND_CLASSIFY_TIMEOUT_S", "5"))
+
+# Poll <VECTOR_STORE_DIR>/CURRENT and swap in newly published snapshots; 0 disables (POST /admin/reload-index still works).
+SNAPSHOT_WATCH_S = float(os.getenv("SNAPSHOT_WATCH_S", "10"))
+# how long a replaced store keeps serving requests that started on it before it is closed
+SNAPSHOT_DRAIN_S = float(os.getenv("SNAPSHOT_DRAIN_S", "30"))
+
+# Load model + index at import time, i.e. once in the gunicorn master (preload_app),
+# so forked workers share those pages copy-on-write. See gunicorn.conf.py.
+PRELOAD_MODELS = os.getenv("PRELOAD_MODELS", "0") == "1"
 
 vs = VectorStore(store_dir=VECTOR_STORE_DIR)
+admission = AdmissionController()
+recent_tickets = RecentTickets()
+
+def _set_index_version(version: str):
+    INDEX_VERSION.clear()
+    INDEX_VERSION.labels(version=version).set(1)
+
+def _load_vector_store():
+    # Load the live snapshot; if there is none, build one from local docs for convenience.
+    t0 = time.perf_counter()
+    vs.version, vs.store_dir = snapshots.resolve(VECTOR_STORE_DIR)
+    built = False
+    if not vs.load():
+        # workers starting together: one builds, the others wait for its snapshot and load it
+        with snapshots.build_lock(VECTOR_STORE_DIR):
+            vs.version, vs.store_dir = snapshots.resolve(VECTOR_STORE_DIR)
+            if not vs.load():
+                vs.store_dir = snapshots.private_staging_dir(VECTOR_STORE_DIR)
+                vs.build_from_dir(DOCS_DIR)
+                vs.save()
+                snapshots.publish(VECTOR_STORE_DIR, vs.store_dir)
+                vs.version, vs.store_dir = snapshots.resolve(VECTOR_STORE_DIR)
+                built = True
+    if built:
+        log.info("Vector store built from local docs", extra={"operation": "vector_build"})
+    else:
+        log.info(f"Vector store {vs.version} loaded", extra={"operation": "vector_load"})
+    _set_index_version(vs.version)
+    STARTUP_SECONDS.labels(stage="index_load").set(time.perf_counter() - t0 - vs.model_load_s)
+
+    # touch the model now so the first request doesn't pay for it
+    vs.model
+    STARTUP_SECONDS.labels(stage="model_load").set(vs.model_load_s)
+
+STARTUP_SECONDS.labels(stage="import").set(time.perf_counter() - _IMPORT_T0)
+
+if PRELOAD_MODELS:
+    _load_vector_store()
+
+_reload_lock = asyncio.Lock()
+_retiring = set()
+_watcher = None
+
+async def _retire(store: VectorStore):
+    await asyncio.sleep(SNAPSHOT_DRAIN_S)
+    await store.aclose()
+
+async def reload_vector_store() -> dict:
+    """Load the published snapshot next to the live one and swap `vs` to it.
+
+    Requests pick up `vs` once when they start, so those in flight finish on
+    the old store, which is closed SNAPSHOT_DRAIN_S later. The embedder and
+    query-embedding cache carry over; nothing is re-downloaded or re-encoded.
+    """
+    global vs
+    async with _reload_lock:
+        old = vs
+        version, path = snapshots.resolve(VECTOR_STORE_DIR)
+        if version == old.version:
+            return {"version": version, "previous": old.version, "reloaded": False}
+        new = VectorStore(store_dir=path)
+        new.share_model(old)
+        t0 = time.perf_counter()
+        try:
+            if not await asyncio.to_thread(new.load):
+                raise FileNotFoundError(f"snapshot {version} is incomplete")
+        except (OSError, RuntimeError, ValueError):
+            INDEX_RELOADS.labels(status="error").inc()
+            log.exception(f"loading vector store {version} failed", extra={"operation": "vector_reload"})
+            raise
+        new.version = version
+        vs = new
+        knn.attach(new)
+        _set_index_version(version)
+        INDEX_RELOADS.labels(status="ok").inc()
+        log.info(f"Vector store {old.version} -> {version}", extra={
+            "operation": "vector_reload", "latency_ms": int((time.perf_counter() - t0) * 1000)})
+        task = asyncio.get_running_loop().create_task(_retire(old))
+        _retiring.add(task)
+        task.add_done_callback(_retiring.discard)
+        return {"version": version, "previous": old.version, "reloaded": True}
+
+async def _watch_snapshots():
+    while True:
+        await asyncio.sleep(SNAPSHOT_WATCH_S)
+        if snapshots.current_version(VECTOR_STORE_DIR) not in (None, vs.version):
+            try:
+                await reload_vector_store()
+            except (OSError, RuntimeError, ValueError):
+                pass  # logged; retried on the next poll
 
 @app.on_event("startup")
 async def startup():
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        await migrations.upgrade(conn)
 
-    # Load vector store; if missing, build from local docs for convenience.
-    if not vs.load():
-        vs.build_from_dir(DOCS_DIR)
-        vs.save()
-        log.info("Vector store built from local docs", extra={"operation": "vector_build"})
-    else:
-        log.info("Vector store loaded", extra={"operation": "vector_load"})
+    if vs.index is None:
+        _load_vector_store()
+
+    await warm_up_classifier()
+    await persistence.start()
+    knn.attach(vs)
+    knn.start()
+    global _watcher
+    if SNAPSHOT_WATCH_S > 0 and _watcher is None:
+        _watcher = asyncio.get_running_loop().create_task(_watch_snapshots())
+
+@app.on_event("shutdown")
+async def shutdown():
+    if _watcher is not None:
+        _watcher.cancel()
+    await knn.stop()
+    await persistence.stop()
+    await vs.aclose()
+
+def _ticket_row(req: TicketRequest, cls: dict, cache_key: str, embedding=None, duplicate_of: int = None) -> dict:
+    return {
+        "external_id": req.external_id,
+        "text": req.text,
+        "product_area": cls["product_area"],
+        "urgency": cls["urgency"],
+        "classification_reason": cls["reason"],
+        "classifier_model": cls["model"],
+        "classification_key": cache_key,
+        "embedding": embedding.tobytes() if embedding is not None else None,
+        "duplicate_of": duplicate_of,
+    }
+
+def _write_backpressure(e: PersistenceBackpressure) -> HTTPException:
+    return HTTPException(status_code=503, detail=f"storage overloaded: {str(e)}", headers={"Retry-After": "1"})
+
+async def _admit(request: Request, text: str, cost: int = 1):
+    # rate limits are per API key (x-api-key), falling back to the client address
+    key = request.headers.get("x-api-key") or (request.client.host if request.client else None)
+    try:
+        await traced("admission", admission.admit(key, text, cost))
+    except AdmissionTooLarge as e:
+        raise HTTPException(status_code=413, detail=f"batch too large for the rate limit: {e}; split it")
+    except AdmissionRejected as e:
+        raise HTTPException(status_code=429, detail=f"rate limited: {e.reason}",
+                            headers={"Retry-After": str(max(1, math.ceil(e.retry_after)))})
 
 @app.middleware("http")
 async def correlation_logging(request: Request, call_next):
     start = time.perf_counter()
     correlation_id = request.headers.get("x-correlation-id") or str(uuid.uuid4())
     request.state.correlation_id = correlation_id
+    # spans anywhere downstream (incl. tasks spawned by the handler) are tagged with it
+    tracing.bind(correlation_id=correlation_id)
 
     try:
         response = await call_next(request)
@@ -60,27 +224,42 @@ async def correlation_logging(request: Request, call_next):
 def metrics():
     return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
 
+@app.post("/debug/profile")
+async def debug_profile(seconds: float = 10.0, interval_ms: float = 5.0):
+    """Sample this worker's stacks for `seconds` under live load; returns collapsed stacks (flame graph input)."""
+    if not profiler.PROFILING_ENABLED:
+        raise HTTPException(status_code=404, detail="Not Found")
+    try:
+        stacks = await asyncio.to_thread(profiler.sample, seconds, interval_ms / 1000.0)
+    except profiler.ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return Response(profiler.collapsed(stacks), media_type="text/plain")
+
+@app.post("/admin/reload-index")
+async def admin_reload_index():
+    """Swap this worker to the snapshot CURRENT points at (the watcher does this on its own every SNAPSHOT_WATCH_S)."""
+    try:
+        return await reload_vector_store()
+    except (OSError, RuntimeError, ValueError) as e:
+        raise HTTPException(status_code=503, detail=f"reload failed: {str(e)}")
+
 @app.post("/classify", response_model=ClassifyResponse)
 async def classify(req: TicketRequest, request: Request):
+    tracing.bind(endpoint="/classify")
     with REQUEST_LATENCY.labels(endpoint="/classify").time():
+        await _admit(request, req.text)
         try:
-            result = classify_with_gemini(req.text)
+            result, cache_key = await classify_cached(req.text)
         except GeminiError as e:
             # Hard failure: explicit so caller knows model is unavailable
             raise HTTPException(status_code=503, detail=f"classifier unavailable: {str(e)}")
 
         # Persist ticket + classification
-        async with SessionLocal() as session:
-            t = Ticket(
-                external_id=req.external_id,
-                text=req.text,
-                product_area=result["product_area"],
-                urgency=result["urgency"],
-                classification_reason=result["reason"],
-                classifier_model=result["model"],
-            )
-            session.add(t)
-            await session.commit()
+        try:
+            # the embedding the local tier computed (if any) trains it on later refreshes
+            await persist_ticket(TicketRecord(ticket=_ticket_row(req, result, cache_key, vs.cached_embedding(req.text))))
+        except PersistenceBackpressure as e:
+            raise _write_backpressure(e)
 
         return ClassifyResponse(
             product_area=result["product_area"],
@@ -89,48 +268,285 @@ async def classify(req: TicketRequest, request: Request):
             model=result["model"],
         )
 
-@app.post("/respond", response_model=RespondResponse)
-async def respond(req: TicketRequest, request: Request):
-    with REQUEST_LATENCY.labels(endpoint="/respond").time():
-        # 1) Classify (Gemini) and persist ticket metadata
+@app.post("/classify/batch", response_model=List[ClassifyResponse])
+async def classify_batch(reqs: List[TicketRequest], request: Request):
+    if len(reqs) > CLASSIFY_BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"batch too large (max {CLASSIFY_BATCH_MAX_ITEMS} tickets)")
+    if not reqs:
+        return []
+    tracing.bind(endpoint="/classify/batch")
+
+    with REQUEST_LATENCY.labels(endpoint="/classify/batch").time():
+        # one token per Gemini prompt the batch packs into (what the limit protects; cache hits only lower it),
+        # so 500 short tickets fit a burst of 20; urgent if any ticket in it looks urgent
+        await _admit(request, "\n".join(r.text for r in reqs), cost=len(pack_batches([r.text for r in reqs])))
         try:
-            cls = classify_with_gemini(req.text)
+            results, keys = await classify_batch_cached([r.text for r in reqs])
         except GeminiError as e:
             raise HTTPException(status_code=503, detail=f"classifier unavailable: {str(e)}")
 
-        async with SessionLocal() as session:
-            t = Ticket(
-                external_id=req.external_id,
-                text=req.text,
-                product_area=cls["product_area"],
-                urgency=cls["urgency"],
-                classification_reason=cls["reason"],
-                classifier_model=cls["model"],
+        # Persist all tickets in a single bulk insert
+        try:
+            await persist_tickets([
+                TicketRecord(ticket=_ticket_row(r, res, key, vs.cached_embedding(r.text)))
+                for r, res, key in zip(reqs, results, keys)
+            ])
+        except PersistenceBackpressure as e:
+            raise _write_backpressure(e)
+
+        return [
+            ClassifyResponse(
+                product_area=res["product_area"],
+                urgency=res["urgency"],
+                reason=res["reason"],
+                model=res["model"],
             )
-            session.add(t)
-            await session.flush()  # get ticket id
+            for res in results
+        ]
 
-            # 2) Retrieve docs
-            t0 = time.perf_counter()
-            retrieved = vs.query(req.text, k=4)
-            retrieval_s = time.perf_counter() - t0
-            RETRIEVAL_LATENCY.observe(retrieval_s)
+def _consume_result(task: asyncio.Task):
+    # a classification we stopped waiting for still fills the cache; just don't leak its error
+    if not task.cancelled():
+        task.exception()
 
-            # store retrieval logs
-            for rank, (chunk, score) in enumerate(retrieved, start=1):
-                session.add(RetrievalLog(ticket_id=t.id, doc_id=chunk.doc_id, score=float(score), rank=rank))
+async def _classify_stage(text: str):
+    """(classification, cache key); in retrieval-first mode failures and timeouts degrade instead of raising."""
+    task = asyncio.ensure_future(traced("classify", classify_cached(text)))
+    if not RESPOND_RETRIEVAL_FIRST:
+        return await task
+    try:
+        # shield: on timeout the Gemini call keeps running and caches its result for the next request
+        return await asyncio.wait_for(asyncio.shield(task), RESPOND_CLASSIFY_TIMEOUT_S)
+    except asyncio.TimeoutError:
+        task.add_done_callback(_consume_result)
+        why = "classifier timeout"
+    except GeminiError as e:
+        why = f"classifier unavailable: {e}"
+    log.warning(f"/respond degraded: {why}", extra={"operation": "classify"})
+    return degraded_classification(text, why)
 
-            # 3) Build controlled answer + citations
-            answer, citations = build_rag_answer(req.text, retrieved)
+async def _retrieve_stage(store: VectorStore, req: TicketRequest, cls_task: Optional[asyncio.Task], k: int = 4):
+    # embed while the classifier runs, then search within the classified product area
+    # (no cls_task: search everything without waiting for the classifier)
+    await traced("embed", store.aembed(req.text))
+    area = None
+    if cls_task is not None:
+        try:
+            cls, _ = await asyncio.shield(cls_task)
+            area = cls["product_area"]
+        except GeminiError:
+            pass
+    t0 = time.perf_counter()
+    retrieved = await traced("search", store.aquery(req.text, k=k, mode=req.retrieval_mode, area=area))
+    RETRIEVAL_LATENCY.observe(time.perf_counter() - t0)
+    return retrieved
+
+async def _classify_and_retrieve(store: VectorStore, req: TicketRequest):
+    """Run classification and retrieval concurrently; latency is max(LLM, embedding) + search."""
+    cls_task = asyncio.ensure_future(_classify_stage(req.text))
+    retrieve_task = asyncio.ensure_future(_retrieve_stage(store, req, cls_task))
+    try:
+        (cls, cache_key), retrieved = await asyncio.gather(cls_task, retrieve_task)
+    except BaseException:
+        for t in (cls_task, retrieve_task):
+            t.cancel()
+        raise
+    return cls, cache_key, retrieved
+
+def _respond_record(store: VectorStore, req: TicketRequest, cls: dict, cache_key: str, retrieved, answer: str,
+                    citations) -> TicketRecord:
+    mode = store.served_mode(req.retrieval_mode)
+    return TicketRecord(
+        # reuse the embedding computed for retrieval (cache hit, no re-encode)
+        ticket=_ticket_row(req, cls, cache_key, store.cached_embedding(req.text)),
+        retrievals=[
+            {"doc_id": chunk.doc_id, "score": float(score), "rank": rank, "retrieval_mode": mode,
+             "index_version": store.version}
+            for rank, (chunk, score) in enumerate(retrieved, start=1)
+        ],
+        response={"answer": answer, "citations_json": str(citations)},
+    )
+
+async def _respond_duplicate(req: TicketRequest, original: RecentTicket, emb) -> RespondResponse:
+    # only the ticket row is written: retrievals and the answer are on the original
+    cls = original.classification
+    row = _ticket_row(req, cls, classification_key(req.text, current_model_name()), emb, duplicate_of=original.ticket_id)
+    try:
+        ticket_id = await traced("persist", persist_ticket(TicketRecord(ticket=row)))
+    except PersistenceBackpressure as e:
+        raise _write_backpressure(e)
+    return RespondResponse(
+        ticket_id=ticket_id,
+        product_area=cls["product_area"],
+        urgency=cls["urgency"],
+        answer=original.answer,
+        citations=[Citation(**c) for c in original.citations],
+        classifier_model=cls["model"],
+        duplicate_of=original.ticket_id,
+    )
+
+@app.post("/respond", response_model=RespondResponse)
+async def respond(req: TicketRequest, request: Request):
+    tracing.bind(endpoint="/respond")
+    with REQUEST_LATENCY.labels(endpoint="/respond").time():
+        await _admit(request, req.text)
+        # the whole request runs on the snapshot that is live now, even if a reload swaps `vs` meanwhile
+        store = vs
+        # 0) Near-duplicate of a recent ticket: reuse its answer (the embedding is reused by retrieval below)
+        mode = req.retrieval_mode or RETRIEVAL_MODE
+        if DEDUP_ENABLED:
+            emb = await traced("embed", store.aembed(req.text))
+            with tracing.span("dedup"):
+                dup = recent_tickets.match(emb, mode, store.version)
+            if dup is not None:
+                return await _respond_duplicate(req, dup[0], emb)
+
+        # 1) Classify (Gemini) and retrieve docs, concurrently
+        try:
+            cls, cache_key, retrieved = await _classify_and_retrieve(store, req)
+        except GeminiError as e:
+            raise HTTPException(status_code=503, detail=f"classifier unavailable: {str(e)}")
+
+        # 2) Build controlled answer + citations
+        answer, citations = build_rag_answer(req.text, retrieved)
+
+        # 3) Persist ticket, retrieval logs and response together
+        try:
+            record = _respond_record(store, req, cls, cache_key, retrieved, answer, citations)
+            ticket_id = await traced("persist", persist_ticket(record))
+        except PersistenceBackpressure as e:
+            raise _write_backpressure(e)
 
-            session.add(ResponseLog(ticket_id=t.id, answer=answer, citations_json=str(citations)))
-            await session.commit()
+        emb = store.cached_embedding(req.text)
+        if DEDUP_ENABLED and emb is not None and not cls["reason"].startswith(FALLBACK_PREFIX):
+            recent_tickets.add(emb, RecentTicket(ticket_id, cls, answer, citations, mode, store.version, time.monotonic()))
 
         return RespondResponse(
-            ticket_id=t.id,
+            ticket_id=ticket_id,
             product_area=cls["product_area"],
             urgency=cls["urgency"],
             answer=answer,
             citations=[Citation(**c) for c in citations],
             classifier_model=cls["model"],
         )
+
+def _sse(event: str, data: str) -> str:
+    return f"event: {event}\ndata: {data}\n\n"
+
+@app.post("/respond/stream")
+async def respond_stream(req: TicketRequest, request: Request):
+    """/respond as Server-Sent Events: retrieval, classification, answer, persisted (or error).
+
+    Citations don't wait for Gemini, so this searches the whole corpus rather
+    than the classified product area. If the client disconnects, the
+    classification, retrieval and persistence still in flight are cancelled.
+    """
+    endpoint = "/respond/stream"
+    store = vs
+    # admit before the stream starts so a shed request gets a real 429
+    tracing.bind(endpoint=endpoint)
+    await _admit(request, req.text)
+
+    async def events():
+        start = time.perf_counter()
+        tracing.bind(endpoint=endpoint)
+        cls_task = asyncio.ensure_future(_classify_stage(req.text))
+        retrieve_task = asyncio.ensure_future(_retrieve_stage(store, req, None))
+        try:
+            retrieved = await retrieve_task
+            answer, citations = build_rag_answer(req.text, retrieved)
+            citations = [Citation(**c) for c in citations]
+            yield _sse("retrieval", json.dumps({"citations": [c.model_dump() for c in citations]}))
+
+            try:
+                cls, cache_key = await cls_task
+            except GeminiError as e:
+                yield _sse("error", json.dumps({"status": 503, "detail": f"classifier unavailable: {str(e)}"}))
+                return
+            yield _sse("classification", ClassifyResponse(
+                product_area=cls["product_area"],
+                urgency=cls["urgency"],
+                reason=cls["reason"],
+                model=cls["model"],
+            ).model_dump_json())
+            yield _sse("answer", json.dumps({"answer": answer}))
+
+            record = _respond_record(store, req, cls, cache_key, retrieved, answer, [c.model_dump() for c in citations])
+            try:
+                ticket_id = await traced("persist", persist_ticket(record))
+            except PersistenceBackpressure as e:
+                yield _sse("error", json.dumps({"status": 503, "detail": f"storage overloaded: {str(e)}"}))
+                return
+            yield _sse("persisted", RespondResponse(
+                ticket_id=ticket_id,
+                product_area=cls["product_area"],
+                urgency=cls["urgency"],
+                answer=answer,
+                citations=citations,
+                classifier_model=cls["model"],
+            ).model_dump_json())
+        finally:
+            # client gone (the response task is cancelled) or an error: stop whatever still runs
+            for t in (cls_task, retrieve_task):
+                if t.done():
+                    _consume_result(t)
+                else:
+                    t.cancel()
+            REQUEST_LATENCY.labels(endpoint=endpoint).observe(time.perf_counter() - start)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/tickets/{ticket_id}/duplicates", response_model=TicketDuplicates)
+async def ticket_duplicates(ticket_id: int, limit: int = 100):
+    """The near-duplicate wave a ticket belongs to: its original and the tickets linked to it."""
+    async with SessionLocal() as session:
+        ticket = await session.get(Ticket, ticket_id)
+        if ticket is None:
+            raise HTTPException(status_code=404, detail="ticket not found")
+        original_id = ticket.duplicate_of or ticket.id
+        rows = (await session.execute(
+            select(Ticket.id, Ticket.external_id, Ticket.created_at)
+            .where(Ticket.duplicate_of == original_id)
+            .order_by(Ticket.id)
+            .limit(min(limit, 1000))
+        )).all()
+    return TicketDuplicates(
+        ticket_id=ticket_id,
+        original_id=original_id,
+        duplicates=[DuplicateTicket(ticket_id=i, external_id=e, created_at=c) for i, e, c in rows],
+    )
+
+@app.get("/tickets", response_model=TicketPage)
+async def list_tickets(product_area: Optional[str] = None, urgency: Optional[str] = None,
+                       external_id: Optional[str] = None, cursor: Optional[str] = None, limit: int = 50):
+    """Tickets newest first; follow `next_cursor` for older pages."""
+    try:
+        rows, next_cursor = await history.ticket_page(limit, cursor, product_area, urgency, external_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return TicketPage(
+        tickets=[
+            TicketSummary(
+                ticket_id=r.id,
+                external_id=r.external_id,
+                text=r.text,
+                product_area=r.product_area,
+                urgency=r.urgency,
+                classifier_model=r.classifier_model,
+                duplicate_of=r.duplicate_of,
+                created_at=r.created_at,
+            )
+            for r in rows
+        ],
+        next_cursor=next_cursor,
+    )
+
+@app.get("/stats", response_model=StatsResponse)
+async def stats(hours: int = 24, product_area: Optional[str] = None):
+    """Ticket counts per product area, urgency and hour, and average retrieval score per mode, from the hourly rollups."""
+    until = datetime.utcnow()
+    return StatsResponse(**await rollups.stats(until - timedelta(hours=max(1, hours)), until, product_area))
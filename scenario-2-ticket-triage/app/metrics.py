@@ -1,7 +1,36 @@
-from prometheus_client import Counter, Histogram
+from prometheus_client import Counter, Gauge, Histogram
 
 REQUEST_LATENCY = Histogram("triage_request_latency_seconds", "API request latency", ["endpoint"])
 RETRIEVAL_LATENCY = Histogram("triage_retrieval_latency_seconds", "Vector retrieval latency")
 GEMINI_CALLS = Counter("triage_gemini_calls_total", "Gemini classification calls", ["status"])
 GEMINI_RETRIES = Counter("triage_gemini_retries_total", "Gemini classification retries")
 EST_TOKENS = Counter("triage_llm_est_tokens_total", "Estimated LLM tokens used", ["model", "kind"])
+GEMINI_IN_FLIGHT = Gauge("triage_gemini_in_flight", "Gemini calls currently awaiting a response")
+GEMINI_QUEUED = Gauge("triage_gemini_queued", "Gemini calls waiting for a concurrency slot")
+CLASSIFY_CACHE_HITS = Counter("triage_classify_cache_hits_total", "Classification cache hits", ["tier"])
+CLASSIFY_CACHE_MISSES = Counter("triage_classify_cache_misses_total", "Classification cache misses")
+CACHE_EVICTIONS = Counter("triage_cache_evictions_total", "Cache evictions", ["cache", "reason"])
+GEMINI_BATCH_FALLBACKS = Counter("triage_gemini_batch_fallbacks_total", "Batched tickets re-classified individually")
+QUERY_BATCH_SIZE = Histogram("triage_vector_query_batch_size", "Queries per batched embed+search", buckets=(1, 2, 4, 8, 16, 32, 64, 128))
+WRITE_QUEUE_DEPTH = Gauge("triage_write_queue_depth", "Records waiting in the write-behind queue")
+WRITE_FLUSH_LATENCY = Histogram("triage_write_flush_latency_seconds", "Write-behind bulk insert latency")
+WRITE_FLUSH_ROWS = Counter("triage_write_flush_rows_total", "Rows written by write-behind flushes")
+WRITE_REJECTED = Counter("triage_write_rejected_total", "Requests rejected because the write queue was full")
+WRITE_FAILURES = Counter("triage_write_failures_total", "Tickets lost in failed write-behind flushes")
+WRITE_RETRIES = Counter("triage_write_retries_total", "Write-behind flush attempts retried after a database error")
+EMBED_CACHE_HITS = Counter("triage_embed_cache_hits_total", "Query embedding cache hits")
+EMBED_CACHE_MISSES = Counter("triage_embed_cache_misses_total", "Query embedding cache misses")
+EMBED_LATENCY = Histogram("triage_embed_latency_seconds", "Query embedding latency per encode call")
+STARTUP_SECONDS = Gauge("triage_startup_seconds", "Time spent per startup stage", ["stage"])
+PARTITION_CHUNKS = Gauge("triage_vector_partition_chunks", "Chunks per product-area partition", ["area"])
+PARTITION_QUERIES = Counter("triage_vector_partition_queries_total", "Partition-restricted queries", ["area", "outcome"])
+STAGE_LATENCY = Histogram("triage_stage_latency_seconds", "Latency per request pipeline stage", ["endpoint", "stage"])
+ADMISSION_QUEUE_DEPTH = Gauge("triage_admission_queue_depth", "Requests waiting for an admission token")
+ADMISSION_WAIT = Histogram("triage_admission_wait_seconds", "Time spent waiting for admission", ["priority"])
+ADMISSION_SHED = Counter("triage_admission_shed_total", "Requests rejected by admission control", ["reason"])
+LOCAL_CLASSIFY = Counter("triage_local_classify_total", "Local kNN tier outcomes (escalated = sent to Gemini)", ["outcome"])
+LOCAL_CLASSIFIER_EXAMPLES = Gauge("triage_local_classifier_examples", "Labeled tickets in the local kNN index")
+DEDUP_CHECKS = Counter("triage_dedup_checks_total", "Near-duplicate checks in /respond", ["outcome"])
+DEDUP_INDEX_SIZE = Gauge("triage_dedup_recent_tickets", "Tickets in the rolling near-duplicate index")
+INDEX_VERSION = Gauge("triage_vector_index_version", "Live vector index snapshot (1 for the active version)", ["version"])
+INDEX_RELOADS = Counter("triage_vector_index_reloads_total", "Vector index snapshot swaps", ["status"])
@@ -0,0 +1,71 @@
+"""Bring an existing database up to the current models.
+
+`create_all` only creates missing tables; it never alters existing ones. Every
+statement here is idempotent (`IF NOT EXISTS` / `IF EXISTS`), so upgrade() runs
+on every startup right after `create_all`, and can also be run by hand:
+
+    python -m app.migrations
+"""
+import asyncio
+from sqlalchemy import text
+
+# one worker at a time (Postgres advisory lock key, any constant)
+_LOCK_KEY = 7262001
+
+_DDL = [
+    # classification cache key, stored query embedding, near-duplicate link
+    "ALTER TABLE tickets ADD COLUMN IF NOT EXISTS classification_key VARCHAR(64)",
+    "CREATE INDEX IF NOT EXISTS ix_tickets_classification_key ON tickets (classification_key)",
+    "ALTER TABLE tickets ADD COLUMN IF NOT EXISTS embedding BYTEA",
+    "ALTER TABLE tickets ADD COLUMN IF NOT EXISTS duplicate_of INTEGER REFERENCES tickets (id)",
+    "CREATE INDEX IF NOT EXISTS ix_tickets_duplicate_of ON tickets (duplicate_of)",
+    # snapshot and mode that served each retrieval
+    "ALTER TABLE retrieval_logs ADD COLUMN IF NOT EXISTS index_version VARCHAR",
+    "CREATE INDEX IF NOT EXISTS ix_retrieval_logs_index_version ON retrieval_logs (index_version)",
+    "ALTER TABLE retrieval_logs ADD COLUMN IF NOT EXISTS retrieval_mode VARCHAR",
+    # keyset pagination; they replace the single-column indexes, which lead with the same columns
+    "CREATE INDEX IF NOT EXISTS ix_tickets_created_id ON tickets (created_at, id)",
+    "CREATE INDEX IF NOT EXISTS ix_tickets_area_created_id ON tickets (product_area, created_at, id)",
+    "CREATE INDEX IF NOT EXISTS ix_tickets_urgency_created_id ON tickets (urgency, created_at, id)",
+    "CREATE INDEX IF NOT EXISTS ix_tickets_external_created_id ON tickets (external_id, created_at, id)",
+    "DROP INDEX IF EXISTS ix_tickets_created_at",
+    "DROP INDEX IF EXISTS ix_tickets_product_area",
+    "DROP INDEX IF EXISTS ix_tickets_urgency",
+    "DROP INDEX IF EXISTS ix_tickets_external_id",
+    # retrieval rollups are keyed by mode too; rows from before count as UNKNOWN (see rollups)
+    "ALTER TABLE retrieval_stats_hourly ADD COLUMN IF NOT EXISTS retrieval_mode VARCHAR NOT NULL DEFAULT 'UNKNOWN'",
+    "ALTER TABLE retrieval_stats_hourly ALTER COLUMN retrieval_mode DROP DEFAULT",
+]
+
+_RETRIEVAL_STATS_PK = """
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM information_schema.key_column_usage
+        WHERE table_name = 'retrieval_stats_hourly' AND constraint_name = 'retrieval_stats_hourly_pkey'
+          AND column_name = 'retrieval_mode'
+    ) THEN
+        ALTER TABLE retrieval_stats_hourly DROP CONSTRAINT IF EXISTS retrieval_stats_hourly_pkey;
+        ALTER TABLE retrieval_stats_hourly ADD PRIMARY KEY (hour, product_area, retrieval_mode);
+    END IF;
+END $$
+"""
+
+async def upgrade(conn) -> None:
+    """Apply every statement inside the caller's transaction (after create_all)."""
+    if conn.dialect.name != "postgresql":
+        return
+    await conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": _LOCK_KEY})
+    for stmt in _DDL:
+        await conn.execute(text(stmt))
+    await conn.execute(text(_RETRIEVAL_STATS_PK))
+
+async def _main():
+    from .db import engine, Base
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await upgrade(conn)
+    print("Schema up to date")
+
+if __name__ == "__main__":
+    asyncio.run(_main())
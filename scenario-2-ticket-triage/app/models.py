@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Float
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Float, LargeBinary, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from .db import Base
@@ -7,19 +7,34 @@ class Ticket(Base):
     __tablename__ = "tickets"
 
     id = Column(Integer, primary_key=True, autoincrement=True)
-    external_id = Column(String, nullable=True, index=True)
+    external_id = Column(String, nullable=True)
     text = Column(Text, nullable=False)
 
-    product_area = Column(String, nullable=True, index=True)
-    urgency = Column(String, nullable=True, index=True)
+    product_area = Column(String, nullable=True)
+    urgency = Column(String, nullable=True)
     classification_reason = Column(Text, nullable=True)
     classifier_model = Column(String, nullable=True)
+    # sha256 of normalized text + model + prompt hash; see classification_cache
+    classification_key = Column(String(64), nullable=True, index=True)
+    # float32 query embedding of `text`; the local kNN classifier is built from these without re-embedding
+    embedding = Column(LargeBinary, nullable=True)
+    # first ticket of a near-duplicate wave whose classification and answer this one reused
+    duplicate_of = Column(Integer, ForeignKey("tickets.id"), nullable=True, index=True)
 
-    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
 
     retrievals = relationship("RetrievalLog", back_populates="ticket", cascade="all, delete-orphan")
     responses = relationship("ResponseLog", back_populates="ticket", cascade="all, delete-orphan")
 
+    # keyset pagination (GET /tickets) walks (created_at, id) newest first, optionally within one filter value;
+    # the leading column also serves plain equality lookups
+    __table_args__ = (
+        Index("ix_tickets_created_id", "created_at", "id"),
+        Index("ix_tickets_area_created_id", "product_area", "created_at", "id"),
+        Index("ix_tickets_urgency_created_id", "urgency", "created_at", "id"),
+        Index("ix_tickets_external_created_id", "external_id", "created_at", "id"),
+    )
+
 class RetrievalLog(Base):
     __tablename__ = "retrieval_logs"
 
@@ -28,6 +43,10 @@ class RetrievalLog(Base):
     doc_id = Column(String, nullable=False)
     score = Column(Float, nullable=False)
     rank = Column(Integer, nullable=False)
+    # dense (cosine), lexical (BM25) or hybrid (RRF): scores are only comparable within one mode
+    retrieval_mode = Column(String, nullable=True)
+    # vector store snapshot that served the retrieval (see snapshots)
+    index_version = Column(String, nullable=True, index=True)
     created_at = Column(DateTime, default=datetime.utcnow, index=True)
 
     ticket = relationship("Ticket", back_populates="retrievals")
@@ -42,3 +61,22 @@ class ResponseLog(Base):
     created_at = Column(DateTime, default=datetime.utcnow, index=True)
 
     ticket = relationship("Ticket", back_populates="responses")
+
+# Rollups for GET /stats, updated in the same transaction as the rows they count (see rollups).
+
+class TicketStatsHourly(Base):
+    __tablename__ = "ticket_stats_hourly"
+
+    hour = Column(DateTime, primary_key=True)
+    product_area = Column(String, primary_key=True)
+    urgency = Column(String, primary_key=True)
+    tickets = Column(Integer, nullable=False, default=0)
+
+class RetrievalStatsHourly(Base):
+    __tablename__ = "retrieval_stats_hourly"
+
+    hour = Column(DateTime, primary_key=True)
+    product_area = Column(String, primary_key=True)
+    retrieval_mode = Column(String, primary_key=True)
+    retrievals = Column(Integer, nullable=False, default=0)
+    score_sum = Column(Float, nullable=False, default=0.0)
@@ -0,0 +1,47 @@
+import os
+import re
+from typing import Dict, Iterable, Optional, Tuple
+import numpy as np
+from .chunk_store import DocChunk
+
+# Partitioned product areas; OTHER (and anything unknown) always searches the whole corpus.
+AREAS = ("CASB", "SWG", "ZTNA")
+
+# Matched against the doc source (file name or URL path), then the page title.
+_PATTERNS = {
+    "CASB": re.compile(r"casb|api[-_ ]?(?:data[-_ ]?)?protection|saas[-_ ]security|cloud[-_ ]access", re.I),
+    "SWG": re.compile(r"swg|secure[-_ ]web[-_ ]gateway|web[-_ ]security|ssl[-_ ](?:inspection|decryption)", re.I),
+    "ZTNA": re.compile(r"ztna|private[-_ ]access|\bnpa\b|zero[-_ ]trust", re.I),
+}
+
+PARTITIONS_FILE = "partitions.npz"
+
+def infer_product_area(doc_id: str, text: str = "") -> str:
+    title = text.split("\n", 1)[0]
+    for source in (doc_id.split("#")[0], title):
+        for area in AREAS:
+            if _PATTERNS[area].search(source):
+                return area
+    return "OTHER"
+
+def build_partitions(chunks: Iterable[Tuple[int, DocChunk]]) -> Dict[str, np.ndarray]:
+    """area -> sorted int64 faiss ids of the chunks in that area."""
+    ids = {area: [] for area in AREAS}
+    for chunk_id, c in chunks:
+        area = infer_product_area(c.doc_id, c.text)
+        if area in ids:
+            ids[area].append(chunk_id)
+    return {area: np.sort(np.asarray(v, dtype=np.int64)) for area, v in ids.items()}
+
+def save_partitions(store_dir: str, parts: Dict[str, np.ndarray]):
+    path = os.path.join(store_dir, PARTITIONS_FILE)
+    with open(path + ".tmp", "wb") as f:
+        np.savez(f, **parts)
+    os.replace(path + ".tmp", path)
+
+def load_partitions(store_dir: str) -> Optional[Dict[str, np.ndarray]]:
+    path = os.path.join(store_dir, PARTITIONS_FILE)
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as npz:
+        return {area: npz[area] for area in npz.files}
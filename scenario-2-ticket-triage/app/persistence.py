@@ -0,0 +1,252 @@
+import os
+import time
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import List, Optional
+from sqlalchemy import insert, text
+from sqlalchemy.exc import SQLAlchemyError, IntegrityError, DataError
+
+from .db import SessionLocal
+from .models import Ticket, RetrievalLog, ResponseLog
+from . import rollups
+from .tracing import span
+from .metrics import (
+    WRITE_QUEUE_DEPTH, WRITE_FLUSH_LATENCY, WRITE_FLUSH_ROWS, WRITE_REJECTED, WRITE_FAILURES, WRITE_RETRIES,
+)
+
+log = logging.getLogger("triage.persistence")
+
+# sync: write inside the request (default). write_behind: enqueue and bulk-insert in the background.
+PERSIST_MODE = os.getenv("PERSIST_MODE", "sync").lower()
+WRITE_QUEUE_SIZE = int(os.getenv("WRITE_QUEUE_SIZE", "10000"))
+WRITE_BATCH_SIZE = int(os.getenv("WRITE_BATCH_SIZE", "500"))
+WRITE_FLUSH_INTERVAL_MS = float(os.getenv("WRITE_FLUSH_INTERVAL_MS", "50"))
+# how long a request may wait for queue space before it is rejected
+WRITE_ENQUEUE_TIMEOUT_S = float(os.getenv("WRITE_ENQUEUE_TIMEOUT_S", "1.0"))
+TICKET_ID_BLOCK = int(os.getenv("TICKET_ID_BLOCK", "200"))
+# a failed flush is retried with exponential backoff before its rows are written one ticket at a time
+WRITE_RETRY_ATTEMPTS = int(os.getenv("WRITE_RETRY_ATTEMPTS", "5"))
+WRITE_RETRY_BACKOFF_S = float(os.getenv("WRITE_RETRY_BACKOFF_S", "0.2"))
+WRITE_RETRY_BACKOFF_MAX_S = float(os.getenv("WRITE_RETRY_BACKOFF_MAX_S", "5"))
+
+class PersistenceBackpressure(RuntimeError):
+    pass
+
+@dataclass
+class TicketRecord:
+    """A ticket with its retrieval and response rows, as plain column dicts."""
+    ticket: dict
+    retrievals: List[dict] = field(default_factory=list)
+    response: Optional[dict] = None
+
+class TicketIdAllocator:
+    """Hands out ticket ids from blocks pre-allocated from the tickets id sequence."""
+
+    def __init__(self, block_size: int = TICKET_ID_BLOCK):
+        self.block_size = block_size
+        self._ids: List[int] = []
+        self._lock = asyncio.Lock()
+
+    async def allocate(self, n: int = 1) -> List[int]:
+        async with self._lock:
+            while len(self._ids) < n:
+                self._ids.extend(await self._reserve(max(self.block_size, n - len(self._ids))))
+            out, self._ids = self._ids[:n], self._ids[n:]
+            return out
+
+    async def _reserve(self, n: int) -> List[int]:
+        stmt = text("SELECT nextval(pg_get_serial_sequence('tickets', 'id')) FROM generate_series(1, :n)")
+        with span("db.reserve_ids"):
+            async with SessionLocal() as session:
+                rows = (await session.execute(stmt, {"n": n})).all()
+        return [r[0] for r in rows]
+
+class WriteBehindWriter:
+    """Bounded in-process queue drained by a background task with multi-row inserts.
+
+    Each flush writes tickets, retrieval logs, response logs and the stats
+    rollups in one transaction (tickets first, for the foreign keys). A failed
+    flush is retried with backoff (the queue backs up meanwhile, and enqueue
+    applies backpressure); a batch that still fails, or that has bad data, is
+    written ticket by ticket so only the offending tickets are lost.
+    """
+
+    def __init__(self, maxsize: int = WRITE_QUEUE_SIZE, batch_size: int = WRITE_BATCH_SIZE,
+                 flush_interval_ms: float = WRITE_FLUSH_INTERVAL_MS):
+        self.batch_size = batch_size
+        self.flush_interval_s = flush_interval_ms / 1000.0
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self._task = None
+        self._inflight = None
+        # records taken off the queue for the batch being collected, not yet handed to a flush
+        self._collecting: List[TicketRecord] = []
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """Stop the background task and flush whatever is still queued."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._inflight is not None:
+            await self._inflight
+        if self._collecting:
+            batch, self._collecting = self._collecting, []
+            await self._flush(batch)
+        while not self._queue.empty():
+            batch = [self._queue.get_nowait() for _ in range(min(self.batch_size, self._queue.qsize()))]
+            await self._flush(batch)
+        WRITE_QUEUE_DEPTH.set(0)
+
+    async def enqueue(self, record: TicketRecord):
+        try:
+            await asyncio.wait_for(self._queue.put(record), timeout=WRITE_ENQUEUE_TIMEOUT_S)
+        except asyncio.TimeoutError:
+            WRITE_REJECTED.inc()
+            raise PersistenceBackpressure("write queue full")
+        WRITE_QUEUE_DEPTH.set(self._queue.qsize())
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            # on self, so a stop() that cancels us mid-collection still flushes what was dequeued
+            batch = self._collecting
+            batch.append(await self._queue.get())
+            deadline = loop.time() + self.flush_interval_s
+            while len(batch) < self.batch_size:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            self._collecting = []
+            WRITE_QUEUE_DEPTH.set(self._queue.qsize())
+            # shield: a shutdown cancel must not abort a half-written batch
+            self._inflight = asyncio.ensure_future(self._flush(batch))
+            await asyncio.shield(self._inflight)
+            self._inflight = None
+
+    async def _flush(self, batch: List[TicketRecord]):
+        if await self._write_with_retry(batch, WRITE_RETRY_ATTEMPTS) or len(batch) == 1:
+            return
+        log.warning(f"write-behind flush of {len(batch)} tickets failed; writing them one by one",
+                    extra={"operation": "db_flush"})
+        # the batch already had its retries: one attempt per ticket isolates bad rows without
+        # stalling the queue for minutes when the database is down for good
+        for record in batch:
+            await self._write_with_retry([record], 0)
+
+    async def _write_with_retry(self, batch: List[TicketRecord], retries: int) -> bool:
+        """Write a batch, retrying transient errors; False (and a single ticket counted lost) if it can't be."""
+        for attempt in range(retries + 1):
+            try:
+                await self._write(batch)
+                return True
+            except (IntegrityError, DataError) as e:
+                # the data itself is bad: retrying the same rows can't succeed
+                error = e
+                break
+            except SQLAlchemyError as e:
+                error = e
+                if attempt == retries:
+                    break
+                WRITE_RETRIES.inc()
+                await asyncio.sleep(min(WRITE_RETRY_BACKOFF_S * 2 ** attempt, WRITE_RETRY_BACKOFF_MAX_S))
+        if len(batch) == 1:
+            WRITE_FAILURES.inc()
+            log.error(f"write-behind write of ticket {batch[0].ticket.get('id')} failed; ticket lost",
+                      exc_info=error, extra={"operation": "db_flush"})
+        return False
+
+    async def _write(self, batch: List[TicketRecord]):
+        tickets = [r.ticket for r in batch]
+        retrievals = [x for r in batch for x in r.retrievals]
+        responses = [r.response for r in batch if r.response is not None]
+        t0 = time.perf_counter()
+        async with SessionLocal() as session:
+            with span("db.insert", rows=len(tickets) + len(retrievals) + len(responses)):
+                await session.execute(insert(Ticket).values(tickets))
+                if retrievals:
+                    await session.execute(insert(RetrievalLog).values(retrievals))
+                if responses:
+                    await session.execute(insert(ResponseLog).values(responses))
+                await rollups.apply(session, batch)
+            with span("db.commit"):
+                await session.commit()
+        WRITE_FLUSH_LATENCY.observe(time.perf_counter() - t0)
+        WRITE_FLUSH_ROWS.inc(len(tickets) + len(retrievals) + len(responses))
+
+_allocator = TicketIdAllocator()
+_writer = WriteBehindWriter()
+
+def write_behind_enabled() -> bool:
+    return PERSIST_MODE == "write_behind"
+
+async def start():
+    if write_behind_enabled():
+        _writer.start()
+
+async def stop():
+    if write_behind_enabled():
+        await _writer.stop()
+
+async def persist_tickets(records: List[TicketRecord]) -> List[int]:
+    """Persist tickets with their logs and return their ids.
+
+    In write-behind mode ids come from a pre-allocated sequence block and the
+    rows are only queued; raises PersistenceBackpressure if the queue stays full.
+    """
+    now = datetime.utcnow()
+    for r in records:
+        r.ticket.setdefault("created_at", now)
+        for row in r.retrievals:
+            row.setdefault("created_at", now)
+        if r.response is not None:
+            r.response.setdefault("created_at", now)
+
+    if write_behind_enabled():
+        ids = await _allocator.allocate(len(records))
+        for ticket_id, r in zip(ids, records):
+            _attach_id(r, ticket_id)
+            await _writer.enqueue(r)
+        return ids
+
+    async with SessionLocal() as session:
+        with span("db.insert", rows=len(records)):
+            result = await session.execute(
+                insert(Ticket).returning(Ticket.id, sort_by_parameter_order=True),
+                [r.ticket for r in records],
+            )
+            ids = list(result.scalars())
+            for ticket_id, r in zip(ids, records):
+                _attach_id(r, ticket_id)
+            retrievals = [x for r in records for x in r.retrievals]
+            responses = [r.response for r in records if r.response is not None]
+            if retrievals:
+                await session.execute(insert(RetrievalLog), retrievals)
+            if responses:
+                await session.execute(insert(ResponseLog), responses)
+            await rollups.apply(session, records)
+        with span("db.commit"):
+            await session.commit()
+    return ids
+
+async def persist_ticket(record: TicketRecord) -> int:
+    return (await persist_tickets([record]))[0]
+
+def _attach_id(record: TicketRecord, ticket_id: int):
+    record.ticket["id"] = ticket_id
+    for row in record.retrievals:
+        row["ticket_id"] = ticket_id
+    if record.response is not None:
+        record.response["ticket_id"] = ticket_id
@@ -0,0 +1,52 @@
+import os
+import sys
+import time
+import threading
+from collections import Counter
+
+# Opt-in: exposes POST /debug/profile. Sampling is cheap but the endpoint reveals code structure.
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "0") == "1"
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "60"))
+
+class ProfilerBusy(RuntimeError):
+    pass
+
+_lock = threading.Lock()
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+def sample(seconds: float, interval_s: float = 0.005) -> Counter:
+    """Sample every thread's stack for `seconds`; returns collapsed stack -> count.
+
+    Runs on the calling thread (which is left out of the samples), so call it
+    from a worker thread, not the event loop. Only one profile runs at a time.
+    """
+    if not _lock.acquire(blocking=False):
+        raise ProfilerBusy("a profile is already running")
+    try:
+        me = threading.get_ident()
+        names = {}
+        stacks: Counter = Counter()
+        deadline = time.monotonic() + min(seconds, PROFILE_MAX_SECONDS)
+        while time.monotonic() < deadline:
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                if ident not in names:
+                    names = {t.ident: t.name for t in threading.enumerate()}
+                parts = []
+                while frame is not None:
+                    parts.append(_frame_label(frame))
+                    frame = frame.f_back
+                parts.append(names.get(ident, str(ident)))
+                stacks[";".join(reversed(parts))] += 1
+            time.sleep(interval_s)
+        return stacks
+    finally:
+        _lock.release()
+
+def collapsed(stacks: Counter) -> str:
+    """Brendan Gregg's collapsed format: feed to flamegraph.pl or speedscope."""
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
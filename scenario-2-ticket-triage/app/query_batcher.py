@@ -0,0 +1,137 @@
+import os
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from .metrics import QUERY_BATCH_SIZE
+from . import tracing
+
+log = logging.getLogger("triage.vector")
+
+# Collect concurrent queries for up to BATCH_WINDOW_MS or BATCH_MAX items, whichever comes first.
+BATCH_WINDOW_MS = float(os.getenv("VECTOR_BATCH_WINDOW_MS", "3"))
+BATCH_MAX = int(os.getenv("VECTOR_BATCH_MAX", "32"))
+
+# pseudo retrieval mode of queue items that only want the query embedding (embed())
+EMBED = "embed"
+
+class QueryBatcher:
+    """Runs store.query_batch on a dedicated thread, coalescing concurrent queries.
+
+    Embedding and FAISS search are CPU-bound, so they never run on the event
+    loop; callers just await query() or embed(). One batch runs at a time, which
+    also means queries arriving while a batch is busy are picked up by the next
+    one. Every text in a batch that needs an embedding is encoded in one call.
+    """
+
+    def __init__(self, store, window_ms: float = BATCH_WINDOW_MS, max_batch: int = BATCH_MAX):
+        self.store = store
+        self.window_s = window_ms / 1000.0
+        self.max_batch = max(1, max_batch)
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="vector-query")
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        while not self._queue.empty():
+            *_, fut = self._queue.get_nowait()
+            if not fut.done():
+                fut.set_exception(RuntimeError("vector query batcher stopped"))
+        self._executor.shutdown(wait=False)
+
+    async def query(self, q: str, k: int, mode: str = None, area: str = None):
+        self.start()
+        fut = asyncio.get_running_loop().create_future()
+        await self._queue.put((q, k, mode, area, tracing.current_correlation_id(), fut))
+        return await fut
+
+    async def embed(self, qs) -> np.ndarray:
+        """Normalized embeddings of qs, encoded together with whatever else is in the batch."""
+        self.start()
+        loop = asyncio.get_running_loop()
+        cid = tracing.current_correlation_id()
+        futs = []
+        for q in qs:
+            fut = loop.create_future()
+            await self._queue.put((q, 0, EMBED, None, cid, fut))
+            futs.append(fut)
+        return np.vstack(await asyncio.gather(*futs))
+
+    async def _collect(self):
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.window_s
+        while len(batch) < self.max_batch:
+            try:
+                batch.append(self._queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        # callers that gave up (disconnect/timeout) don't need a result
+        return [item for item in batch if not item[-1].done()]
+
+    def _query_grouped(self, batch):
+        results = [None] * len(batch)
+
+        def cids(positions):
+            # spans of a shared batch carry the correlation_ids of every request in it
+            return ",".join(sorted({batch[p][4] for p in positions if batch[p][4]})) or None
+
+        # one encode for all texts that need an embedding; query_batch below then hits the cache
+        dense = [pos for pos, item in enumerate(batch) if item[2] != "lexical"]
+        if dense:
+            with tracing.bound(cids(dense), "vector_batch"):
+                embs = self.store.embed_queries([batch[p][0] for p in dense])
+            for p, e in zip(dense, embs):
+                if batch[p][2] == EMBED:
+                    results[p] = e
+
+        # one store.query_batch call per (retrieval mode, product area) in the batch
+        groups = {}
+        for pos, (_, _, mode, area, _, _) in enumerate(batch):
+            if mode != EMBED:
+                groups.setdefault((mode, area), []).append(pos)
+        for (mode, area), positions in groups.items():
+            k_max = max(batch[p][1] for p in positions)
+            with tracing.bound(cids(positions), "vector_batch"):
+                res = self.store.query_batch([batch[p][0] for p in positions], k_max, mode, area)
+            for p, r in zip(positions, res):
+                results[p] = r
+        return results
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            if not batch:
+                continue
+            QUERY_BATCH_SIZE.observe(len(batch))
+            try:
+                results = await loop.run_in_executor(self._executor, self._query_grouped, batch)
+            except Exception as e:
+                log.exception("batched vector query failed", extra={"operation": "vector_query"})
+                for *_, fut in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+                continue
+            for (_, k, mode, _, _, fut), res in zip(batch, results):
+                if not fut.done():
+                    fut.set_result(res if mode == EMBED else res[:k])
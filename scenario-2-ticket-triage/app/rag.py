@@ -1,7 +1,12 @@
 from typing import List, Dict
 from .vector_store import VectorStore, DocChunk
+from .tracing import span
 
 def build_rag_answer(ticket_text: str, retrieved: List[tuple[DocChunk, float]]) -> tuple[str, List[Dict]]:
+    with span("answer"):
+        return _build_rag_answer(ticket_text, retrieved)
+
+def _build_rag_answer(ticket_text: str, retrieved: List[tuple[DocChunk, float]]) -> tuple[str, List[Dict]]:
     # Lightweight, controlled answer:
     # - We do NOT let the model hallucinate.
     # - We produce a structured, support-agent-friendly response.
@@ -0,0 +1,145 @@
+"""Hourly rollups behind GET /stats, so dashboards never scan tickets or retrieval_logs.
+
+Counts are added with an upsert in the same transaction that writes the
+tickets (sync and write-behind paths alike), so rollups and raw rows can't
+drift apart. For a database that has tickets from before the rollups
+existed, rebuild them once:
+
+    python -m app.rollups --rebuild
+"""
+import asyncio
+import argparse
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import List, Optional
+from sqlalchemy import delete, func, select, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from .db import SessionLocal
+from .models import TicketStatsHourly, RetrievalStatsHourly
+
+UNKNOWN = "UNKNOWN"
+
+def hour_of(ts: datetime) -> datetime:
+    return ts.replace(minute=0, second=0, microsecond=0)
+
+async def apply(session, records: List) -> None:
+    """Add a batch of TicketRecords (with created_at set) to the rollups, inside the caller's transaction."""
+    tickets: Counter = Counter()
+    retrievals: Counter = Counter()
+    scores: Counter = Counter()
+    for r in records:
+        hour = hour_of(r.ticket["created_at"])
+        area = r.ticket.get("product_area") or UNKNOWN
+        tickets[(hour, area, r.ticket.get("urgency") or UNKNOWN)] += 1
+        for row in r.retrievals:
+            key = (hour, area, row.get("retrieval_mode") or UNKNOWN)
+            retrievals[key] += 1
+            scores[key] += row["score"]
+
+    # sorted, so concurrent transactions lock the same rows in the same order (no deadlocks)
+    if tickets:
+        stmt = pg_insert(TicketStatsHourly).values([
+            {"hour": h, "product_area": a, "urgency": u, "tickets": n} for (h, a, u), n in sorted(tickets.items())
+        ])
+        await session.execute(stmt.on_conflict_do_update(
+            index_elements=["hour", "product_area", "urgency"],
+            set_={"tickets": TicketStatsHourly.tickets + stmt.excluded.tickets},
+        ))
+    if retrievals:
+        stmt = pg_insert(RetrievalStatsHourly).values([
+            {"hour": h, "product_area": a, "retrieval_mode": m, "retrievals": n, "score_sum": scores[(h, a, m)]}
+            for (h, a, m), n in sorted(retrievals.items())
+        ])
+        await session.execute(stmt.on_conflict_do_update(
+            index_elements=["hour", "product_area", "retrieval_mode"],
+            set_={
+                "retrievals": RetrievalStatsHourly.retrievals + stmt.excluded.retrievals,
+                "score_sum": RetrievalStatsHourly.score_sum + stmt.excluded.score_sum,
+            },
+        ))
+
+async def stats(since: datetime, until: datetime, product_area: Optional[str] = None) -> dict:
+    """Rollup rows for [since, until), whole hours."""
+    t_stmt = (
+        select(TicketStatsHourly.hour, TicketStatsHourly.product_area, TicketStatsHourly.urgency,
+               TicketStatsHourly.tickets)
+        .where(TicketStatsHourly.hour >= hour_of(since), TicketStatsHourly.hour < until)
+        .order_by(TicketStatsHourly.hour, TicketStatsHourly.product_area, TicketStatsHourly.urgency)
+    )
+    r_stmt = (
+        select(RetrievalStatsHourly.product_area, RetrievalStatsHourly.retrieval_mode,
+               func.sum(RetrievalStatsHourly.retrievals), func.sum(RetrievalStatsHourly.score_sum))
+        .where(RetrievalStatsHourly.hour >= hour_of(since), RetrievalStatsHourly.hour < until)
+        .group_by(RetrievalStatsHourly.product_area, RetrievalStatsHourly.retrieval_mode)
+        .order_by(RetrievalStatsHourly.product_area, RetrievalStatsHourly.retrieval_mode)
+    )
+    if product_area:
+        t_stmt = t_stmt.where(TicketStatsHourly.product_area == product_area)
+        r_stmt = r_stmt.where(RetrievalStatsHourly.product_area == product_area)
+    async with SessionLocal() as session:
+        hourly = (await session.execute(t_stmt)).all()
+        retrieval = (await session.execute(r_stmt)).all()
+
+    by_area: Counter = Counter()
+    by_urgency: Counter = Counter()
+    for _, area, urgency, n in hourly:
+        by_area[area] += n
+        by_urgency[urgency] += n
+    # cosine, BM25 and RRF scores live on different scales: never average across modes
+    mode_n: Counter = Counter()
+    mode_sum: Counter = Counter()
+    for _, mode, n, s in retrieval:
+        mode_n[mode] += n
+        mode_sum[mode] += s
+    return {
+        "since": hour_of(since),
+        "until": until,
+        "tickets": sum(by_area.values()),
+        "by_product_area": dict(by_area),
+        "by_urgency": dict(by_urgency),
+        "hourly": [{"hour": h, "product_area": a, "urgency": u, "tickets": n} for h, a, u, n in hourly],
+        "retrieval": [
+            {"product_area": a, "retrieval_mode": m, "retrievals": n, "avg_score": s / n if n else None}
+            for a, m, n, s in retrieval
+        ],
+        "avg_retrieval_score": {m: mode_sum[m] / n for m, n in mode_n.items() if n},
+    }
+
+async def rebuild():
+    """Recompute both rollups from the raw tables (one full scan; run while writes are paused)."""
+    async with SessionLocal() as session:
+        await session.execute(delete(TicketStatsHourly))
+        await session.execute(delete(RetrievalStatsHourly))
+        await session.execute(text(
+            "INSERT INTO ticket_stats_hourly (hour, product_area, urgency, tickets) "
+            "SELECT date_trunc('hour', created_at), COALESCE(product_area, :unknown), COALESCE(urgency, :unknown), "
+            "count(*) FROM tickets GROUP BY 1, 2, 3"
+        ), {"unknown": UNKNOWN})
+        # bucketed by the ticket's hour and area, like apply()
+        await session.execute(text(
+            "INSERT INTO retrieval_stats_hourly (hour, product_area, retrieval_mode, retrievals, score_sum) "
+            "SELECT date_trunc('hour', t.created_at), COALESCE(t.product_area, :unknown), "
+            "COALESCE(r.retrieval_mode, :unknown), count(*), sum(r.score) "
+            "FROM retrieval_logs r JOIN tickets t ON t.id = r.ticket_id GROUP BY 1, 2, 3"
+        ), {"unknown": UNKNOWN})
+        await session.commit()
+
+async def _main(args):
+    from .db import engine, Base
+    from .migrations import upgrade
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await upgrade(conn)
+    if args.rebuild:
+        await rebuild()
+        print("Rollups rebuilt")
+    s = await stats(datetime.utcnow() - timedelta(hours=args.hours), datetime.utcnow())
+    print(f"Last {args.hours}h: {s['tickets']} tickets {s['by_product_area']}, "
+          f"avg retrieval score per mode {s['avg_retrieval_score']}")
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Ticket stats rollups")
+    ap.add_argument("--rebuild", action="store_true", help="recompute the rollups from tickets/retrieval_logs")
+    ap.add_argument("--hours", type=int, default=24, help="window for the summary printed afterwards")
+    asyncio.run(_main(ap.parse_args()))
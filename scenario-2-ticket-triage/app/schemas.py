@@ -1,9 +1,12 @@
+from datetime import datetime
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import Dict, List, Literal, Optional
 
 class TicketRequest(BaseModel):
     text: str = Field(..., min_length=1)
     external_id: Optional[str] = None
+    # /respond only; defaults to RETRIEVAL_MODE
+    retrieval_mode: Optional[Literal["dense", "lexical", "hybrid"]] = None
 
 class ClassifyResponse(BaseModel):
     product_area: str
@@ -23,3 +26,54 @@ class RespondResponse(BaseModel):
     answer: str
     citations: List[Citation]
     classifier_model: str
+    # set when a recent near-identical ticket's answer was reused
+    duplicate_of: Optional[int] = None
+
+class DuplicateTicket(BaseModel):
+    ticket_id: int
+    external_id: Optional[str] = None
+    created_at: datetime
+
+class TicketDuplicates(BaseModel):
+    ticket_id: int
+    # the first ticket of the wave (ticket_id itself if it is the original)
+    original_id: int
+    duplicates: List[DuplicateTicket]
+
+class TicketSummary(BaseModel):
+    ticket_id: int
+    external_id: Optional[str] = None
+    text: str
+    product_area: Optional[str] = None
+    urgency: Optional[str] = None
+    classifier_model: Optional[str] = None
+    duplicate_of: Optional[int] = None
+    created_at: datetime
+
+class TicketPage(BaseModel):
+    tickets: List[TicketSummary]
+    # pass as ?cursor= for the next (older) page; None on the last page
+    next_cursor: Optional[str] = None
+
+class HourlyTicketCount(BaseModel):
+    hour: datetime
+    product_area: str
+    urgency: str
+    tickets: int
+
+class RetrievalScoreStats(BaseModel):
+    product_area: str
+    # scores are cosine (dense), BM25 (lexical) or RRF (hybrid), so they are averaged per mode
+    retrieval_mode: str
+    retrievals: int
+    avg_score: Optional[float] = None
+
+class StatsResponse(BaseModel):
+    since: datetime
+    until: datetime
+    tickets: int
+    by_product_area: Dict[str, int]
+    by_urgency: Dict[str, int]
+    hourly: List[HourlyTicketCount]
+    retrieval: List[RetrievalScoreStats]
+    avg_retrieval_score: Dict[str, float]  # per retrieval mode
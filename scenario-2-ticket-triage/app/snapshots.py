@@ -0,0 +1,102 @@
+"""Versioned vector store snapshots under one root directory.
+
+    <root>/versions/<version>/   one complete store (faiss.index, chunk store, meta.json, ...)
+    <root>/staging/              the snapshot being built by an ingest run (and its checkpoint)
+    <root>/CURRENT               name of the live version, replaced atomically
+    <root>/build.lock            held by whoever is building or publishing a snapshot
+
+Published snapshots are never modified, so a worker can keep serving an old
+one while it loads the new one. A root without CURRENT is a store written
+before snapshots existed; it is served as version "unversioned".
+"""
+import os
+import fcntl
+import shutil
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Optional, Tuple
+
+CURRENT_FILE = "CURRENT"
+VERSIONS_DIR = "versions"
+STAGING_DIR = "staging"
+LOCK_FILE = "build.lock"
+UNVERSIONED = "unversioned"
+
+# published versions kept besides the live one (workers may still be mapping them)
+SNAPSHOT_KEEP = int(os.getenv("SNAPSHOT_KEEP", "3"))
+
+def current_version(root: str) -> Optional[str]:
+    try:
+        with open(os.path.join(root, CURRENT_FILE), "r", encoding="utf-8") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+def resolve(root: str) -> Tuple[str, str]:
+    """(version, directory) of the live snapshot."""
+    version = current_version(root)
+    if version is None:
+        return UNVERSIONED, root
+    return version, os.path.join(root, VERSIONS_DIR, version)
+
+def staging_dir(root: str, reset: bool = False) -> str:
+    path = os.path.join(root, STAGING_DIR)
+    if reset:
+        shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+def private_staging_dir(root: str) -> str:
+    """A fresh staging directory of this process's own, for builds without checkpoints.
+
+    Call under build_lock(): leftovers of crashed builds are removed first."""
+    for name in os.listdir(root):
+        if name.startswith(STAGING_DIR + "-"):
+            shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+    return tempfile.mkdtemp(prefix=STAGING_DIR + "-", dir=root)
+
+@contextmanager
+def build_lock(root: str):
+    """Exclusive across processes (flock); blocks until whoever else is building has published."""
+    os.makedirs(root, exist_ok=True)
+    with open(os.path.join(root, LOCK_FILE), "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+def _new_version(root: str) -> str:
+    # microseconds: a name pruned away must never be handed out again, or it would sort before newer ones
+    base = datetime.utcnow().strftime("%Y%m%dT%H%M%S%fZ")
+    version, n = base, 1
+    while os.path.exists(os.path.join(root, VERSIONS_DIR, version)):
+        n += 1
+        version = f"{base}-{n}"
+    return version
+
+def publish(root: str, src: str) -> str:
+    """Move a finished store directory into versions/ and point CURRENT at it; returns the version."""
+    os.makedirs(os.path.join(root, VERSIONS_DIR), exist_ok=True)
+    version = _new_version(root)
+    os.rename(src, os.path.join(root, VERSIONS_DIR, version))
+    tmp = os.path.join(root, CURRENT_FILE + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(version + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, os.path.join(root, CURRENT_FILE))
+    prune(root)
+    return version
+
+def prune(root: str, keep: int = SNAPSHOT_KEEP):
+    """Delete all but the live version and the `keep` newest others."""
+    live = current_version(root)
+    versions_dir = os.path.join(root, VERSIONS_DIR)
+    if not os.path.isdir(versions_dir):
+        return
+    # version names sort by creation time
+    old = sorted((v for v in os.listdir(versions_dir) if v != live), reverse=True)
+    for version in old[keep:]:
+        shutil.rmtree(os.path.join(versions_dir, version), ignore_errors=True)
@@ -0,0 +1,60 @@
+import os
+import time
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+from .metrics import STAGE_LATENCY
+
+log = logging.getLogger("triage.trace")
+
+# Log one JSON line per span (in addition to the histogram).
+TRACE_LOG_SPANS = os.getenv("TRACE_LOG_SPANS", "1") == "1"
+
+# Set per request by the correlation_logging middleware / the endpoint handler. Tasks
+# inherit both; executor threads don't, so work handed to a thread re-binds them.
+_correlation_id: ContextVar[Optional[str]] = ContextVar("correlation_id", default=None)
+_endpoint: ContextVar[str] = ContextVar("endpoint", default="")
+
+def current_correlation_id() -> Optional[str]:
+    return _correlation_id.get()
+
+def bind(correlation_id: Optional[str] = None, endpoint: Optional[str] = None):
+    if correlation_id is not None:
+        _correlation_id.set(correlation_id)
+    if endpoint is not None:
+        _endpoint.set(endpoint)
+
+@contextmanager
+def bound(correlation_id: Optional[str], endpoint: str):
+    """bind() for a block, e.g. on a worker thread serving several requests."""
+    t1, t2 = _correlation_id.set(correlation_id), _endpoint.set(endpoint)
+    try:
+        yield
+    finally:
+        _correlation_id.reset(t1)
+        _endpoint.reset(t2)
+
+@contextmanager
+def span(stage: str, **fields):
+    """Time a block: observed in triage_stage_latency_seconds{endpoint,stage} and logged as JSON."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - t0
+        endpoint = _endpoint.get()
+        STAGE_LATENCY.labels(endpoint=endpoint, stage=stage).observe(elapsed)
+        if TRACE_LOG_SPANS:
+            log.info("span", extra={
+                "operation": stage,
+                "latency_ms": round(elapsed * 1000, 3),
+                "correlation_id": _correlation_id.get(),
+                "endpoint": endpoint,
+                **fields,
+            })
+
+async def traced(stage: str, aw, **fields):
+    """await aw inside a span."""
+    with span(stage, **fields):
+        return await aw
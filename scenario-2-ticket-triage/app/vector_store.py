@@ -1,24 +1,102 @@
 import os
 import json
-from dataclasses import dataclass
-from typing import List, Tuple
+import hashlib
+import logging
+import threading
+from typing import Dict, List, Mapping, Optional, Tuple
 import numpy as np
 import faiss
 from sentence_transformers import SentenceTransformer
 import time
+from .query_batcher import QueryBatcher
+from .tracing import span
+from .lru import LRUTTLCache, normalize_text
+from .metrics import EMBED_CACHE_HITS, EMBED_CACHE_MISSES, EMBED_LATENCY, PARTITION_CHUNKS, PARTITION_QUERIES
+from .chunk_store import DocChunk, ChunkStore, write_chunk_store
+from .bm25 import BM25Index, rrf_fuse
+from .partitions import build_partitions, save_partitions, load_partitions
+from .index_factory import (
+    build_index, with_ids, apply_search_params, search_params, index_params_from_env, search_overrides_from_env,
+)
 
-@dataclass
-class DocChunk:
-    doc_id: str
-    text: str
+log = logging.getLogger("triage.vector")
+
+# Map the index file instead of reading it, so workers share the page cache.
+INDEX_MMAP = os.getenv("VECTOR_INDEX_MMAP", "1") == "1"
+# int8: dynamic int8 quantization of the embedder's Linear layers for faster CPU inference.
+# Build the index with the same setting, since query and doc embeddings should come from the same model.
+EMBEDDING_QUANTIZE = os.getenv("EMBEDDING_QUANTIZE", "").lower()
+EMBED_CACHE_SIZE = int(os.getenv("EMBED_CACHE_SIZE", "20000"))
+EMBED_CACHE_TTL_S = float(os.getenv("EMBED_CACHE_TTL_S", "86400"))
+
+# dense: FAISS only. lexical: BM25 only. hybrid: both, fused with reciprocal-rank fusion.
+RETRIEVAL_MODES = ("dense", "lexical", "hybrid")
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "dense").lower()
+# Candidates each retriever contributes to the fusion. BM25 recovers the exact-token
+# matches, so the dense side can stay small.
+HYBRID_DENSE_K = int(os.getenv("HYBRID_DENSE_K", "8"))
+HYBRID_LEXICAL_K = int(os.getenv("HYBRID_LEXICAL_K", "20"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+
+# Restrict retrieval to the ticket's product area (ID-filtered search), falling back to the
+# whole corpus when the best in-area cosine score is below PARTITION_MIN_SCORE.
+RETRIEVAL_PARTITIONS = os.getenv("RETRIEVAL_PARTITIONS", "1") == "1"
+PARTITION_MIN_SCORE = float(os.getenv("PARTITION_MIN_SCORE", "0.3"))
+
+def chunk_hash(text: str) -> str:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+def load_embedder(model_name: str, quantize: str = EMBEDDING_QUANTIZE) -> SentenceTransformer:
+    model = SentenceTransformer(model_name, device="cpu" if quantize else None)
+    if quantize == "int8":
+        import torch
+        model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    elif quantize:
+        raise ValueError(f"unsupported EMBEDDING_QUANTIZE={quantize!r} (expected int8)")
+    return model
 
 class VectorStore:
-    def __init__(self, store_dir: str, model_name: str = "all-MiniLM-L6-v2"):
+    def __init__(self, store_dir: str, model_name: str = "all-MiniLM-L6-v2", index_params: dict = None):
         self.store_dir = store_dir
         self.model_name = model_name
-        self.model = SentenceTransformer(model_name)
+        # loaded on first use: importing the app or loading the index doesn't pay for it
+        self._model = None
+        self._model_lock = threading.Lock()
+        self.model_load_s = 0.0
         self.index = None
-        self.chunks: List[DocChunk] = []
+        self.index_params = index_params or index_params_from_env()
+        # faiss id -> chunk; ids are stable across incremental re-ingests.
+        # A dict while building, a memory-mapped ChunkStore after load().
+        self.chunks: Mapping[int, DocChunk] = {}
+        # BM25 over the same ids; None for stores written before hybrid retrieval
+        self.bm25: Optional[BM25Index] = None
+        # product area -> sorted chunk ids; None for stores written before partitions
+        self.partitions: Optional[Dict[str, np.ndarray]] = None
+        self._selectors = {}
+        self._doc_ids = None
+        self.next_id = 0
+        self._batcher = None
+        self._embed_cache = LRUTTLCache(EMBED_CACHE_SIZE, EMBED_CACHE_TTL_S, name="query_embedding")
+        # snapshot version this store was loaded from (see snapshots)
+        self.version: Optional[str] = None
+
+    @property
+    def model(self) -> SentenceTransformer:
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    t0 = time.perf_counter()
+                    self._model = load_embedder(self.model_name)
+                    self.model_load_s = time.perf_counter() - t0
+                    log.info("Embedding model loaded", extra={"operation": "model_load",
+                                                               "latency_ms": int(self.model_load_s * 1000)})
+        return self._model
+
+    def share_model(self, other: "VectorStore"):
+        """Reuse another store's embedder and query-embedding cache (e.g. when loading a new snapshot)."""
+        if other.model_name == self.model_name and other._model is not None:
+            self._model = other._model
+            self._embed_cache = other._embed_cache
 
     def _paths(self):
         return (
@@ -27,28 +105,81 @@ class VectorStore:
             os.path.join(self.store_dir, "meta.json"),
         )
 
-    def load(self) -> bool:
-        idx_path, chunks_path, meta_path = self._paths()
-        if not (os.path.exists(idx_path) and os.path.exists(chunks_path) and os.path.exists(meta_path)):
+    @property
+    def doc_ids(self) -> Dict[str, int]:
+        # only incremental sync needs this, so it isn't built at load time
+        if self._doc_ids is None:
+            if isinstance(self.chunks, ChunkStore):
+                self._doc_ids = self.chunks.doc_ids()
+            else:
+                self._doc_ids = {c.doc_id: i for i, c in self.chunks.items()}
+        return self._doc_ids
+
+    def load(self, mmap: bool = INDEX_MMAP) -> bool:
+        idx_path, legacy_chunks_path, meta_path = self._paths()
+        has_chunks = ChunkStore.exists(self.store_dir) or os.path.exists(legacy_chunks_path)
+        if not (os.path.exists(idx_path) and has_chunks and os.path.exists(meta_path)):
             return False
 
-        self.index = faiss.read_index(idx_path)
-        with open(chunks_path, "r", encoding="utf-8") as f:
-            raw = json.load(f)
-        self.chunks = [DocChunk(**x) for x in raw]
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        # stores written before the index factory existed are flat
+        self.index_params = {**meta.get("index", {"type": "flat"}), **search_overrides_from_env()}
+
+        self.index = None
+        if mmap:
+            try:
+                self.index = faiss.read_index(idx_path, faiss.IO_FLAG_MMAP)
+            except RuntimeError:
+                log.info("index type can't be memory-mapped; reading it", extra={"operation": "vector_load"})
+        if self.index is None:
+            self.index = faiss.read_index(idx_path)
+        apply_search_params(self.index, self.index_params)
+
+        if ChunkStore.exists(self.store_dir):
+            self.chunks = ChunkStore(self.store_dir)
+        else:
+            with open(legacy_chunks_path, "r", encoding="utf-8") as f:
+                raw = json.load(f)
+            # legacy stores have no ids: faiss labels are list positions
+            self.chunks = {x.pop("id", pos): DocChunk(**x) for pos, x in enumerate(raw)}
+        self.bm25 = BM25Index.load(self.store_dir)
+        self.set_partitions(load_partitions(self.store_dir))
+        self._doc_ids = None
+        self.next_id = meta.get("next_id", -1)
         return True
 
-    def save(self):
+    def save(self, write_chunks: bool = True):
+        """Persist index, chunks and meta. write_chunks=False when the chunk
+        store was already written by a ChunkStoreWriter (streaming ingest)."""
         os.makedirs(self.store_dir, exist_ok=True)
-        idx_path, chunks_path, meta_path = self._paths()
-        faiss.write_index(self.index, idx_path)
-        with open(chunks_path, "w", encoding="utf-8") as f:
-            json.dump([c.__dict__ for c in self.chunks], f, ensure_ascii=False, indent=2)
-        with open(meta_path, "w", encoding="utf-8") as f:
-            json.dump({"model_name": self.model_name, "chunks": len(self.chunks)}, f, indent=2)
-
-    def build_from_dir(self, docs_dir: str, chunk_size: int = 800, overlap: int = 120):
-        self.chunks = []
+        idx_path, legacy_chunks_path, meta_path = self._paths()
+        # write-then-rename everywhere: other processes may have these files mapped
+        faiss.write_index(self.index, idx_path + ".tmp")
+        os.replace(idx_path + ".tmp", idx_path)
+        if write_chunks:
+            write_chunk_store(self.store_dir, self.chunks.items())
+        if self.bm25 is not None:
+            self.bm25.save(self.store_dir)
+        if self.partitions is not None:
+            save_partitions(self.store_dir, self.partitions)
+        with open(meta_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "model_name": self.model_name,
+                    "chunks": len(self.chunks),
+                    "next_id": self.next_id,
+                    "index": self.index_params,
+                },
+                f,
+                indent=2,
+            )
+        os.replace(meta_path + ".tmp", meta_path)
+        if os.path.exists(legacy_chunks_path):
+            os.remove(legacy_chunks_path)
+
+    def build_from_dir(self, docs_dir: str, chunk_size: int = 800, overlap: int = 120) -> dict:
+        chunks = []
         for name in sorted(os.listdir(docs_dir)):
             path = os.path.join(docs_dir, name)
             if not os.path.isfile(path):
@@ -56,26 +187,247 @@ class VectorStore:
             with open(path, "r", encoding="utf-8") as f:
                 text = f.read().strip()
             for i, chunk in enumerate(_chunk_text(text, chunk_size=chunk_size, overlap=overlap)):
-                self.chunks.append(DocChunk(doc_id=f"{name}#chunk{i}", text=chunk))
+                chunks.append(DocChunk(doc_id=f"{name}#chunk{i}", text=chunk))
+        return self.sync_chunks(chunks)
+
+    def _embed(self, chunks: List[DocChunk]) -> np.ndarray:
+        embs = self.model.encode([c.text for c in chunks], normalize_embeddings=True)
+        return np.array(embs, dtype=np.float32)
+
+    def build_from_chunks(self, chunks: List[DocChunk]):
+        """Embed chunks and (re)build the index configured by index_params (see index_factory)."""
+        for c in chunks:
+            c.content_hash = chunk_hash(c.text)
+        embs = self._embed(chunks)
+        index, self.index_params = build_index(embs, self.index_params)
+        self.index = with_ids(index)
+        ids = np.arange(len(chunks), dtype=np.int64)
+        self.index.add_with_ids(embs, ids)
+        self.chunks = dict(zip(ids.tolist(), chunks))
+        self._doc_ids = None
+        self.next_id = len(chunks)
+        self.build_lexical()
+        self.set_partitions(build_partitions(self.chunks.items()))
+
+    def build_lexical(self):
+        """(Re)build the BM25 index from the current chunks; tokenizing is cheap next to embedding."""
+        # sorted runs spill next to the store being built (which save() hasn't created yet on a fresh build)
+        os.makedirs(self.store_dir, exist_ok=True)
+        self.bm25 = BM25Index.build(((i, c.text) for i, c in self.chunks.items()), spill_dir=self.store_dir)
+
+    def set_partitions(self, parts: Optional[Dict[str, np.ndarray]]):
+        self.partitions = parts
+        self._selectors = {}
+        for area, ids in (parts or {}).items():
+            PARTITION_CHUNKS.labels(area=area).set(len(ids))
+
+    def sync_chunks(self, chunks: List[DocChunk]) -> dict:
+        """Bring the index in line with `chunks`, embedding only new or changed ones.
+
+        Chunks are matched by doc_id and compared by content hash; a changed
+        chunk keeps its faiss id. Returns added/updated/removed/unchanged counts.
+        """
+        if self.index is None or self.next_id < 0:
+            # nothing to diff against (or a legacy positional store)
+            self.build_from_chunks(chunks)
+            return {"added": len(chunks), "updated": 0, "removed": 0, "unchanged": 0}
+
+        if isinstance(self.chunks, ChunkStore):
+            # a mapped index and chunk store are read-only; sync on private copies. The index is re-read
+            # without IO_FLAG_MMAP: clone_index can't copy IVF's mapped OnDiskInvertedLists
+            self.index = faiss.read_index(self._paths()[0])
+            apply_search_params(self.index, self.index_params)
+            self.chunks = dict(self.chunks.items())
 
-        embs = self.model.encode([c.text for c in self.chunks], normalize_embeddings=True)
-        embs = np.array(embs, dtype=np.float32)
-        dim = embs.shape[1]
-        self.index = faiss.IndexFlatIP(dim)
-        self.index.add(embs)
+        stats = {"added": 0, "updated": 0, "removed": 0, "unchanged": 0}
+        seen = set()
+        pending: List[Tuple[int, DocChunk]] = []
+        for c in chunks:
+            c.content_hash = chunk_hash(c.text)
+            seen.add(c.doc_id)
+            old_id = self.doc_ids.get(c.doc_id)
+            if old_id is None:
+                pending.append((self.next_id, c))
+                self.next_id += 1
+                stats["added"] += 1
+            elif self.chunks[old_id].content_hash != c.content_hash:
+                pending.append((old_id, c))
+                stats["updated"] += 1
+            else:
+                stats["unchanged"] += 1
 
-    def query(self, q: str, k: int = 4) -> List[Tuple[DocChunk, float]]:
+        removed = [i for doc_id, i in self.doc_ids.items() if doc_id not in seen]
+        stats["removed"] = len(removed)
+        if stats["unchanged"] == 0:
+            # everything has to be embedded anyway; a fresh build also retrains IVF centroids
+            self.build_from_chunks(chunks)
+            return stats
+        self.remove_ids(removed + [i for i, _ in pending if i in self.chunks])
+        for i in removed:
+            del self.doc_ids[self.chunks.pop(i).doc_id]
+
+        if pending:
+            embs = self._embed([c for _, c in pending])
+            self.index.add_with_ids(embs, np.array([i for i, _ in pending], dtype=np.int64))
+            for i, c in pending:
+                self.chunks[i] = c
+                self.doc_ids[c.doc_id] = i
+        if pending or removed or self.bm25 is None:
+            self.build_lexical()
+        if pending or removed or self.partitions is None:
+            self.set_partitions(build_partitions(self.chunks.items()))
+        return stats
+
+    def remove_ids(self, ids: List[int]):
+        if not ids:
+            return
+        try:
+            self.index.remove_ids(np.array(ids, dtype=np.int64))
+        except RuntimeError:
+            # HNSW can't delete: rebuild the graph from the stored vectors of the kept ids (no re-embedding)
+            drop = set(ids)
+            keep = np.array([i for i in faiss.vector_to_array(self.index.id_map) if i not in drop], dtype=np.int64)
+            vecs = np.vstack([self.index.reconstruct(int(i)) for i in keep])
+            log.info(f"rebuilding {self.index_params['type']} index without {len(drop)} ids",
+                     extra={"operation": "vector_sync"})
+            index, self.index_params = build_index(vecs, self.index_params)
+            self.index = with_ids(index)
+            self.index.add_with_ids(vecs, keep)
+
+    def _embed_key(self, text: str) -> str:
+        # the MiniLM tokenizer lower-cases and splits on whitespace, so normalized
+        # variants of a text embed identically
+        raw = f"{self.model_name}\x00{normalize_text(text)}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def embed_queries(self, qs: List[str]) -> np.ndarray:
+        """Normalized query embeddings, served from the LRU cache where possible."""
+        keys = [self._embed_key(q) for q in qs]
+        cached = [self._embed_cache.get(k) for k in keys]
+        misses = [i for i, e in enumerate(cached) if e is None]
+        EMBED_CACHE_HITS.inc(len(qs) - len(misses))
+        EMBED_CACHE_MISSES.inc(len(misses))
+        if misses:
+            t0 = time.perf_counter()
+            with span("vector.encode", queries=len(misses)):
+                embs = self.model.encode([qs[i] for i in misses], normalize_embeddings=True)
+            EMBED_LATENCY.observe(time.perf_counter() - t0)
+            for i, e in zip(misses, np.asarray(embs, dtype=np.float32)):
+                cached[i] = e
+                self._embed_cache.put(keys[i], e)
+        return np.vstack(cached)
+
+    def cached_embedding(self, text: str) -> Optional[np.ndarray]:
+        """Embedding computed earlier for this text (e.g. by this request's query), or None."""
+        return self._embed_cache.get(self._embed_key(text))
+
+    def query(self, q: str, k: int = 4, mode: str = None, area: str = None) -> List[Tuple[DocChunk, float]]:
+        return self.query_batch([q], k, mode, area)[0]
+
+    def _selector(self, area: str):
+        # IDSelectorBatch hashes the ids once; reuse it across queries
+        sel = self._selectors.get(area)
+        if sel is None:
+            ids = self.partitions[area]
+            sel = self._selectors[area] = faiss.IDSelectorBatch(len(ids), faiss.swig_ptr(ids))
+        return sel
+
+    def _dense_search(self, qs: List[str], k: int, area: str = None) -> List[List[Tuple[int, float]]]:
+        params = search_params(self.index, self._selector(area)) if area else None
+        embs = self.embed_queries(qs)
+        with span("vector.faiss", queries=len(qs)):
+            scores, idxs = self.index.search(embs, k, params=params)
+        return [[(int(i), float(s)) for i, s in zip(row_idxs, row_scores) if i >= 0]
+                for row_idxs, row_scores in zip(idxs, scores)]
+
+    def _retrieve(self, qs: List[str], k: int, mode: str, area: str = None):
+        """(hits, best dense cosine per query or None) for one mode, optionally within a partition."""
+        allowed = self.partitions[area] if area else None
+        if mode == "dense":
+            hits = self._dense_search(qs, k, area)
+            return hits, [h[0][1] if h else None for h in hits]
+        if mode == "lexical":
+            with span("vector.bm25", queries=len(qs)):
+                return [self.bm25.search(q, k, allowed) for q in qs], [None] * len(qs)
+        dense = self._dense_search(qs, max(k, HYBRID_DENSE_K), area)
+        with span("vector.bm25", queries=len(qs)):
+            lexical = [self.bm25.search(q, max(k, HYBRID_LEXICAL_K), allowed) for q in qs]
+        with span("vector.fuse"):
+            hits = [rrf_fuse([[i for i, _ in d], [i for i, _ in lx]], k, RRF_K) for d, lx in zip(dense, lexical)]
+        return hits, [d[0][1] if d else None for d in dense]
+
+    def _partition_for(self, area: Optional[str]) -> Optional[str]:
+        if not (RETRIEVAL_PARTITIONS and area and self.partitions):
+            return None
+        ids = self.partitions.get(area)
+        return area if ids is not None and len(ids) else None
+
+    def served_mode(self, mode: str = None) -> str:
+        """The mode query_batch really searches with for `mode`, i.e. what its scores mean."""
+        mode = mode or RETRIEVAL_MODE
+        if mode not in RETRIEVAL_MODES:
+            raise ValueError(f"unknown retrieval mode {mode!r}")
+        if mode != "dense" and self.bm25 is None:
+            return "dense"
+        return mode
+
+    def query_batch(self, qs: List[str], k: int = 4, mode: str = None,
+                    area: str = None) -> List[List[Tuple[DocChunk, float]]]:
+        """Top-k chunks per query. Scores are cosine (dense), BM25 (lexical) or RRF (hybrid).
+
+        With a product `area` the search is restricted to that partition; queries
+        whose best in-area match is weak are re-run over the whole corpus.
+        """
+        served = self.served_mode(mode)
         if self.index is None or not self.chunks:
-            return []
-        q_emb = self.model.encode([q], normalize_embeddings=True)
-        q_emb = np.array(q_emb, dtype=np.float32)
-        scores, idxs = self.index.search(q_emb, k)
-        out = []
-        for rank, (i, s) in enumerate(zip(idxs[0], scores[0]), start=1):
-            if i < 0 or i >= len(self.chunks):
-                continue
-            out.append((self.chunks[i], float(s)))
-        return out
+            return [[] for _ in qs]
+        if served != (mode or RETRIEVAL_MODE):
+            log.warning("no BM25 index for this store; using dense retrieval", extra={"operation": "vector_query"})
+        mode = served
+
+        area = self._partition_for(area)
+        hits, best = self._retrieve(qs, k, mode, area)
+        if area:
+            weak = [i for i, (h, b) in enumerate(zip(hits, best))
+                    if not h or (b is not None and b < PARTITION_MIN_SCORE)]
+            PARTITION_QUERIES.labels(area=area, outcome="partition").inc(len(qs) - len(weak))
+            if weak:
+                PARTITION_QUERIES.labels(area=area, outcome="fallback").inc(len(weak))
+                fallback, _ = self._retrieve([qs[i] for i in weak], k, mode)
+                for i, h in zip(weak, fallback):
+                    hits[i] = h
+
+        results = []
+        for row in hits:
+            out = []
+            for i, s in row:
+                chunk = self.chunks.get(i)
+                if chunk is None:
+                    continue
+                out.append((chunk, s))
+            results.append(out)
+        return results
+
+    async def aquery(self, q: str, k: int = 4, mode: str = None, area: str = None) -> List[Tuple[DocChunk, float]]:
+        """Non-blocking query; concurrent calls are micro-batched on a worker thread."""
+        if self._batcher is None:
+            self._batcher = QueryBatcher(self)
+        return await self._batcher.query(q, k, mode or RETRIEVAL_MODE, area)
+
+    async def aembed(self, q: str) -> np.ndarray:
+        """Embed (and cache) a query off the event loop, ahead of a search that needs more inputs."""
+        return (await self.aembed_many([q]))[0]
+
+    async def aembed_many(self, qs: List[str]) -> np.ndarray:
+        """Like aembed; queued with concurrent queries so they share one encode call."""
+        if self._batcher is None:
+            self._batcher = QueryBatcher(self)
+        return await self._batcher.embed(qs)
+
+    async def aclose(self):
+        if self._batcher is not None:
+            await self._batcher.stop()
+            self._batcher = None
 
 def _chunk_text(text: str, chunk_size: int, overlap: int):
     if chunk_size <= 0:
@@ -0,0 +1,193 @@
+"""Micro-benchmarks for the hot paths over synthetic corpora.
+
+Covers _chunk_text, ingestion (VectorStore.build_from_chunks + save), index
+load, VectorStore.query (dense/lexical/hybrid) and build_rag_answer. By default
+a deterministic hashing embedder stands in for MiniLM, so 1M-chunk corpora
+build in minutes and timings isolate our code from the model; --real-model
+uses the configured SentenceTransformer instead.
+
+    python -m evaluation.bench_micro --sizes 1000,10000,100000
+    python -m evaluation.bench_micro --sizes 1000000 --queries 200
+
+--check-sync instead checks VectorStore.sync_chunks against a saved and
+reloaded (memory-mapped) store of every index type, and exits non-zero on a failure.
+"""
+import argparse
+import json
+import shutil
+import subprocess
+import tempfile
+import time
+import zlib
+from pathlib import Path
+import numpy as np
+
+from app.vector_store import VectorStore, DocChunk, _chunk_text
+from app.rag import build_rag_answer
+from app.index_factory import index_params_from_env
+
+AREAS = ("casb", "swg", "ztna", "general")
+_WORDS = (
+    "policy connector tenant steering client gateway tunnel certificate decryption inspection user group "
+    "posture publisher application access denied allowed blocked latency timeout upload download alert "
+    "incident dlp malware threat api instance sanctioned unsanctioned proxy pac traffic private network"
+).split()
+
+class HashEmbedder:
+    """Feature-hashing bag of words: deterministic, model-free, same interface as SentenceTransformer.encode."""
+
+    def __init__(self, dim: int = 384):
+        self.dim = dim
+
+    def encode(self, texts, normalize_embeddings: bool = True, **_):
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for tok in text.lower().split():
+                out[row, zlib.crc32(tok.encode("utf-8")) % self.dim] += 1.0
+        if normalize_embeddings:
+            out /= np.maximum(np.linalg.norm(out, axis=1, keepdims=True), 1e-12)
+        return out
+
+def synthetic_chunks(n: int, seed: int = 0, words: int = 40):
+    rng = np.random.default_rng(seed)
+    picks = rng.integers(0, len(_WORDS), (n, words))
+    codes = rng.integers(100, 999, n)
+    chunks = []
+    for i in range(n):
+        area = AREAS[i % len(AREAS)]
+        text = f"{area} ERR_{codes[i]} " + " ".join(_WORDS[j] for j in picks[i])
+        chunks.append(DocChunk(doc_id=f"{area}_doc{i // 8}.txt#chunk{i % 8}", text=text))
+    return chunks
+
+def synthetic_queries(chunks, nq: int, seed: int = 1):
+    rng = np.random.default_rng(seed)
+    out = []
+    for i in rng.integers(0, len(chunks), nq):
+        toks = chunks[i].text.split()
+        out.append(" ".join(toks[:2] + list(rng.choice(toks[2:], 8))))
+    return out
+
+def _timeit(fn, repeat: int) -> dict:
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    samples.sort()
+    return {
+        "p50_ms": round(samples[len(samples) // 2] * 1000, 4),
+        "p95_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000, 4),
+        "mean_ms": round(sum(samples) / len(samples) * 1000, 4),
+    }
+
+def _git_rev():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def bench_chunking(doc_chars: int = 200_000) -> dict:
+    text = " ".join(_WORDS) * (doc_chars // len(" ".join(_WORDS)) + 1)
+    return _timeit(lambda: list(_chunk_text(text[:doc_chars], chunk_size=800, overlap=120)), repeat=20)
+
+def bench_corpus(n: int, nq: int, k: int, real_model: bool) -> dict:
+    store_dir = tempfile.mkdtemp(prefix="triage-bench-")
+    try:
+        chunks = synthetic_chunks(n)
+        vs = VectorStore(store_dir=store_dir)
+        if not real_model:
+            vs._model = HashEmbedder()
+
+        t0 = time.perf_counter()
+        vs.build_from_chunks(chunks)
+        vs.save()
+        ingest_s = time.perf_counter() - t0
+
+        loaded = VectorStore(store_dir=store_dir)
+        t0 = time.perf_counter()
+        loaded.load()
+        load_s = time.perf_counter() - t0
+        loaded._model = vs._model
+
+        queries = synthetic_queries(chunks, nq)
+        loaded.embed_queries(queries)  # warm the embedding cache: time search, not the encoder
+        result = {
+            "chunks": n,
+            "ingest_s": round(ingest_s, 3),
+            "ingest_chunks_per_sec": round(n / ingest_s, 1),
+            "index_load_ms": round(load_s * 1000, 3),
+            "query": {},
+        }
+        for mode in ("dense", "lexical", "hybrid"):
+            it = iter(queries * 2)
+            result["query"][mode] = _timeit(lambda: loaded.query(next(it), k=k, mode=mode), repeat=nq)
+        it = iter(queries * 2)
+        result["query"]["dense_area"] = _timeit(lambda: loaded.query(next(it), k=k, area="SWG"), repeat=nq)
+
+        retrieved = loaded.query(queries[0], k=k, mode="dense")
+        result["build_rag_answer"] = _timeit(lambda: build_rag_answer(queries[0], retrieved), repeat=1000)
+        return result
+    finally:
+        shutil.rmtree(store_dir, ignore_errors=True)
+
+def check_sync(index_type: str, n: int = 5000) -> dict:
+    """Save, reload (mapped where possible) and sync one changed, one removed and one added chunk."""
+    store_dir = tempfile.mkdtemp(prefix="triage-sync-")
+    try:
+        chunks = synthetic_chunks(n)
+        vs = VectorStore(store_dir=store_dir, index_params={**index_params_from_env(), "type": index_type})
+        vs._model = HashEmbedder()
+        vs.build_from_chunks(chunks)
+        vs.save()
+
+        loaded = VectorStore(store_dir=store_dir)
+        loaded.load()
+        loaded._model = vs._model
+        changed = DocChunk(doc_id=chunks[0].doc_id, text="ztna ERR_SYNC changed chunk text")
+        added = DocChunk(doc_id="new_doc.txt#chunk0", text="swg ERR_NEW added chunk text")
+        stats = loaded.sync_chunks([changed] + chunks[1:-1] + [added])
+        assert stats == {"added": 1, "updated": 1, "removed": 1, "unchanged": n - 2}, stats
+        assert loaded.index.ntotal == n, loaded.index.ntotal
+        loaded.save()
+
+        again = VectorStore(store_dir=store_dir)
+        again.load()
+        again._model = vs._model
+        assert again.index.ntotal == n, again.index.ntotal
+        for c in (changed, added):
+            hits = again.query(c.text, k=1, mode="lexical")
+            assert hits and hits[0][0].doc_id == c.doc_id, (c.doc_id, hits)
+        return {"index": again.index_params["type"], **stats}
+    finally:
+        shutil.rmtree(store_dir, ignore_errors=True)
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sizes", default="1000,10000,100000", help="comma-separated corpus sizes (chunks)")
+    ap.add_argument("--queries", type=int, default=500)
+    ap.add_argument("-k", type=int, default=4)
+    ap.add_argument("--real-model", action="store_true", help="embed with the SentenceTransformer model")
+    ap.add_argument("--out", default="evaluation/bench_micro.json")
+    ap.add_argument("--check-sync", action="store_true", help="check sync_chunks on reloaded stores and exit")
+    args = ap.parse_args()
+
+    if args.check_sync:
+        for index_type in ("flat", "ivf_flat", "ivf_pq", "hnsw"):
+            print(f"sync_chunks on a reloaded {index_type} store: ok {check_sync(index_type)}")
+        return
+
+    report = {"git_rev": _git_rev(), "k": args.k, "chunk_text": bench_chunking(), "corpora": []}
+    print(f"_chunk_text (200k chars): {report['chunk_text']['p50_ms']} ms p50")
+    for n in (int(x) for x in args.sizes.split(",")):
+        r = bench_corpus(n, args.queries, args.k, args.real_model)
+        report["corpora"].append(r)
+        q = r["query"]
+        print(f"n={n:>8}: ingest {r['ingest_chunks_per_sec']:>9.0f} chunks/s, load {r['index_load_ms']:.1f} ms, "
+              f"query p50 dense {q['dense']['p50_ms']:.3f} / lexical {q['lexical']['p50_ms']:.3f} / "
+              f"hybrid {q['hybrid']['p50_ms']:.3f} ms")
+
+    Path(args.out).write_text(json.dumps(report, indent=2))
+    print(f"Report written to: {args.out}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""How the evaluation reaches the pipeline: over HTTP, or in-process without the server.
+
+Both expose async classify(text) and respond(text, mode) returning the same
+JSON shapes as /classify and /respond.
+"""
+import sys
+import asyncio
+from pathlib import Path
+import httpx
+
+BASE_URL = "http://localhost:8002"
+
+class HttpPipeline:
+    def __init__(self, base_url: str = BASE_URL, timeout: float = 60, workers: int = 8):
+        limits = httpx.Limits(max_connections=workers, max_keepalive_connections=workers)
+        self.client = httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits)
+
+    async def classify(self, text: str) -> dict:
+        r = await self.client.post("/classify", json={"text": text})
+        r.raise_for_status()
+        return r.json()
+
+    async def respond(self, text: str, mode: str = None) -> dict:
+        payload = {"text": text}
+        if mode:
+            payload["retrieval_mode"] = mode
+        r = await self.client.post("/respond", json=payload)
+        r.raise_for_status()
+        return r.json()
+
+    async def aclose(self):
+        await self.client.aclose()
+
+class InProcessPipeline:
+    """Calls the classifier, vector store and answer builder directly: no server, no DB writes.
+
+    classify() skips the classification cache so stability measures the model
+    itself; respond() goes through it like /respond does.
+    """
+
+    def __init__(self, store_dir: str = "data/vector_store", docs_dir: str = "data/docs"):
+        # runs from the service root; make `app` importable when started as evaluation/eval_runner.py
+        sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+        from app.vector_store import VectorStore
+        from app.rag import build_rag_answer
+        from app.gemini_classifier import classify_with_gemini_async
+        from app.classification_cache import classify_cached
+        from app import snapshots
+
+        self._build_rag_answer = build_rag_answer
+        self._classify = classify_with_gemini_async
+        self._classify_cached = classify_cached
+        version, path = snapshots.resolve(store_dir)
+        self.vs = VectorStore(store_dir=path)
+        self.vs.version = version
+        if not self.vs.load():
+            self.vs.build_from_dir(docs_dir)
+
+    async def classify(self, text: str) -> dict:
+        return await self._classify(text)
+
+    async def respond(self, text: str, mode: str = None) -> dict:
+        cls, _ = await self._classify_cached(text)
+        retrieved = await self.vs.aquery(text, k=4, mode=mode, area=cls["product_area"])
+        answer, citations = self._build_rag_answer(text, retrieved)
+        return {
+            "product_area": cls["product_area"],
+            "urgency": cls["urgency"],
+            "answer": answer,
+            "citations": citations,
+            "classifier_model": cls["model"],
+        }
+
+    async def aclose(self):
+        await self.vs.aclose()
+
+async def bounded_map(fn, items, workers: int):
+    """await fn(item) for every item with at most `workers` in flight; results in input order."""
+    sem = asyncio.Semaphore(max(1, workers))
+
+    async def one(item):
+        async with sem:
+            return await fn(item)
+
+    return await asyncio.gather(*[one(item) for item in items])
@@ -1,25 +1,22 @@
 import collections
-import requests
+from clients import bounded_map
 
-CLASSIFY_URL = "http://localhost:8002/classify"
+async def evaluate_classifier(cases, pipeline, runs=5, workers=8):
+    """Runs classify multiple times per case (concurrently) and measures output stability."""
+    jobs = [(case, run) for case in cases for run in range(runs)]
+    answers = await bounded_map(lambda job: pipeline.classify(job[0]["text"]), jobs, workers)
 
-def evaluate_classifier(cases, runs=5, timeout=30):
-    """Runs /classify multiple times per case and measures output stability."""
-    results = {}
-
-    for case in cases:
-        outputs = []
-        for _ in range(runs):
-            r = requests.post(CLASSIFY_URL, json={"text": case["text"]}, timeout=timeout)
-            r.raise_for_status()
-            j = r.json()
-            outputs.append((j.get("product_area"), j.get("urgency")))
+    per_case = collections.defaultdict(list)
+    for (case, _), j in zip(jobs, answers):
+        per_case[case["id"]].append((j.get("product_area"), j.get("urgency")))
 
+    results = {}
+    for case_id, outputs in per_case.items():
         counter = collections.Counter(outputs)
         most_common, count = counter.most_common(1)[0]
         stability = count / runs
 
-        results[case["id"]] = {
+        results[case_id] = {
             "most_common": {"product_area": most_common[0], "urgency": most_common[1]},
             "stability": stability,
             "distribution": {f"{k[0]}|{k[1]}": v for k, v in counter.items()},
@@ -1,32 +1,89 @@
-import requests
-from sentence_transformers import SentenceTransformer, util
-
-RESPOND_URL = "http://localhost:8002/respond"
-_MODEL = SentenceTransformer("all-MiniLM-L6-v2")
-
-def groundedness(answer: str, citations: list[dict]) -> float:
-    """Semantic similarity between answer and concatenated citation excerpts."""
-    context = " ".join([c.get("excerpt", "") for c in citations]).strip()
-    if not context:
-        return 0.0
-    emb_a = _MODEL.encode(answer, convert_to_tensor=True, normalize_embeddings=True)
-    emb_c = _MODEL.encode(context, convert_to_tensor=True, normalize_embeddings=True)
-    return float(util.cos_sim(emb_a, emb_c).cpu().numpy()[0][0])
-
-def evaluate_rag(cases, timeout=60):
-    results = []
-    for case in cases:
-        r = requests.post(RESPOND_URL, json={"text": case["text"]}, timeout=timeout)
-        r.raise_for_status()
-        j = r.json()
+import hashlib
+from pathlib import Path
+import numpy as np
+from sentence_transformers import SentenceTransformer
+from clients import bounded_map
+
+MODEL_NAME = "all-MiniLM-L6-v2"
+CACHE_PATH = Path("evaluation/.embedding_cache.npz")
+_MODEL = None
+
+def _model() -> SentenceTransformer:
+    global _MODEL
+    if _MODEL is None:
+        _MODEL = SentenceTransformer(MODEL_NAME)
+    return _MODEL
+
+class EmbeddingCache:
+    """Normalized embeddings keyed by sha256(model + text), persisted across runs."""
+
+    def __init__(self, path: Path = CACHE_PATH):
+        self.path = path
+        self.vecs = {}
+        if path.exists():
+            with np.load(path) as npz:
+                self.vecs = dict(zip(npz["keys"].tolist(), npz["vecs"]))
+        self.dirty = False
+
+    @staticmethod
+    def key(text: str) -> str:
+        return hashlib.sha256(f"{MODEL_NAME}\x00{text}".encode("utf-8")).hexdigest()
+
+    def encode(self, texts: list[str], batch_size: int = 64) -> np.ndarray:
+        """All texts' embeddings; misses are encoded together in one batched call."""
+        keys = [self.key(t) for t in texts]
+        missing = {k: t for k, t in zip(keys, texts) if k not in self.vecs}
+        if missing:
+            embs = _model().encode(list(missing.values()), batch_size=batch_size, normalize_embeddings=True)
+            self.vecs.update(zip(missing, np.asarray(embs, dtype=np.float32)))
+            self.dirty = True
+        return np.vstack([self.vecs[k] for k in keys]) if keys else np.zeros((0, 0), dtype=np.float32)
 
-        g = groundedness(j.get("answer",""), j.get("citations", []))
+    def save(self):
+        if not self.dirty:
+            return
+        keys = list(self.vecs)
+        with open(self.path, "wb") as f:
+            np.savez(f, keys=np.array(keys), vecs=np.vstack([self.vecs[k] for k in keys]))
+        self.dirty = False
 
-        results.append({
+def _context(citations: list[dict]) -> str:
+    return " ".join([c.get("excerpt", "") for c in citations]).strip()
+
+def groundedness_batch(pairs: list[tuple[str, list[dict]]], cache: EmbeddingCache) -> list[float]:
+    """Semantic similarity between each answer and its concatenated citation excerpts."""
+    contexts = [_context(citations) for _, citations in pairs]
+    scored = [i for i, c in enumerate(contexts) if c]
+    out = [0.0] * len(pairs)
+    if scored:
+        embs = cache.encode([pairs[i][0] for i in scored] + [contexts[i] for i in scored])
+        answers, ctxs = embs[:len(scored)], embs[len(scored):]
+        for i, sim in zip(scored, np.sum(answers * ctxs, axis=1)):
+            out[i] = float(sim)
+    return out
+
+def groundedness(answer: str, citations: list[dict], cache: EmbeddingCache = None) -> float:
+    return groundedness_batch([(answer, citations)], cache or EmbeddingCache())[0]
+
+def retrieval_hit(citations: list[dict], expected_doc: str) -> float:
+    """1.0 if any citation comes from the expected document (doc_ids are '<doc>#chunkN')."""
+    return float(any(c.get("doc_id", "").split("#")[0] == expected_doc for c in citations))
+
+async def evaluate_rag(cases, pipeline, cache: EmbeddingCache, mode=None, workers=8):
+    """mode: dense/lexical/hybrid retrieval; None uses the service default."""
+    responses = await bounded_map(lambda case: pipeline.respond(case["text"], mode), cases, workers)
+    scores = groundedness_batch([(j.get("answer", ""), j.get("citations", [])) for j in responses], cache)
+
+    results = []
+    for case, j, g in zip(cases, responses, scores):
+        row = {
             "id": case["id"],
             "product_area": j.get("product_area"),
             "urgency": j.get("urgency"),
             "groundedness": g,
             "num_citations": len(j.get("citations", [])),
-        })
+        }
+        if case.get("expected_doc"):
+            row["hit_at_k"] = retrieval_hit(j.get("citations", []), case["expected_doc"])
+        results.append(row)
     return results
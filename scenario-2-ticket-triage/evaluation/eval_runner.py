@@ -1,25 +1,54 @@
+import os
 import json
+import time
+import asyncio
+import argparse
 from pathlib import Path
+from clients import HttpPipeline, InProcessPipeline, BASE_URL
 from eval_classifier import evaluate_classifier
-from eval_rag import evaluate_rag
+from eval_rag import evaluate_rag, EmbeddingCache
 
 CASES_PATH = Path("evaluation/test_cases.json")
 REPORT_JSON = Path("evaluation/report.json")
+# retrieval modes to compare, e.g. RAG_MODES=hybrid to evaluate just one
+RAG_MODES = [m for m in os.getenv("RAG_MODES", "dense,lexical,hybrid").split(",") if m]
 
-def main():
+def _avg(rows, key):
+    vals = [x[key] for x in rows if key in x]
+    return sum(vals) / len(vals) if vals else None
+
+async def run(args) -> dict:
     cases = json.loads(CASES_PATH.read_text(encoding="utf-8"))
+    pipeline = InProcessPipeline() if args.in_process else HttpPipeline(args.url, workers=args.workers)
+    cache = EmbeddingCache()
+    try:
+        cls = await evaluate_classifier(cases, pipeline, runs=args.runs, workers=args.workers)
+        rag = {mode: await evaluate_rag(cases, pipeline, cache, mode=mode, workers=args.workers) for mode in RAG_MODES}
+    finally:
+        cache.save()
+        await pipeline.aclose()
+    return {"classifier": cls, "rag": rag}
 
-    cls = evaluate_classifier(cases, runs=5)
-    rag = evaluate_rag(cases)
+def main():
+    ap = argparse.ArgumentParser(description="Classifier stability and RAG groundedness evaluation")
+    ap.add_argument("--workers", type=int, default=8, help="cases evaluated concurrently")
+    ap.add_argument("--runs", type=int, default=5, help="classifier runs per case")
+    ap.add_argument("--in-process", action="store_true", help="call the pipeline directly instead of over HTTP")
+    ap.add_argument("--url", default=BASE_URL)
+    args = ap.parse_args()
 
-    report = {"classifier": cls, "rag": rag}
+    t0 = time.perf_counter()
+    report = asyncio.run(run(args))
     REPORT_JSON.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    cls, rag = report["classifier"], report["rag"]
 
-    print(f"✅ Evaluation completed. Report written to: {REPORT_JSON}")
+    print(f"✅ Evaluation completed in {time.perf_counter() - t0:.1f}s. Report written to: {REPORT_JSON}")
 
-    avg_groundedness = sum(x["groundedness"] for x in rag) / max(1, len(rag))
+    for mode, rows in rag.items():
+        hit = _avg(rows, "hit_at_k")
+        hit_s = f", hit@k {hit:.2f}" if hit is not None else ""
+        print(f"[{mode}] avg groundedness: {_avg(rows, 'groundedness'):.3f}{hit_s}")
     avg_stability = sum(v["stability"] for v in cls.values()) / max(1, len(cls))
-    print(f"Avg groundedness: {avg_groundedness:.3f}")
     print(f"Avg classifier stability: {avg_stability:.3f}")
 
 if __name__ == "__main__":
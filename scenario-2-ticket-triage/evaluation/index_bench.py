@@ -0,0 +1,147 @@
+"""Offline ANN index comparison: recall@k vs the Flat baseline, QPS and memory.
+
+Run from the service root, either on the current vector store or a synthetic corpus:
+
+    python -m evaluation.index_bench --store data/vector_store
+    python -m evaluation.index_bench --synthetic 200000
+"""
+import argparse
+import json
+import time
+from pathlib import Path
+import numpy as np
+import faiss
+
+from app.index_factory import build_index, index_params_from_env
+from app.bm25 import BM25Index
+from app import snapshots
+
+# (label, overrides on top of index_params_from_env())
+CONFIGS = [
+    ("flat", {"type": "flat"}),
+    ("ivf_flat/nprobe=4", {"type": "ivf_flat", "nprobe": 4}),
+    ("ivf_flat/nprobe=16", {"type": "ivf_flat", "nprobe": 16}),
+    ("ivf_flat/nprobe=64", {"type": "ivf_flat", "nprobe": 64}),
+    ("ivf_pq/nprobe=16", {"type": "ivf_pq", "nprobe": 16}),
+    ("ivf_pq/nprobe=64", {"type": "ivf_pq", "nprobe": 64}),
+    ("hnsw/ef=32", {"type": "hnsw", "ef_search": 32}),
+    ("hnsw/ef=128", {"type": "hnsw", "ef_search": 128}),
+]
+
+def _normalize(x: np.ndarray) -> np.ndarray:
+    return (x / np.linalg.norm(x, axis=1, keepdims=True)).astype(np.float32)
+
+def _store_ids(index) -> np.ndarray:
+    # after incremental ingests removed chunks, ids are no longer 0..ntotal-1
+    index = faiss.downcast_index(index)
+    if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        return faiss.vector_to_array(index.id_map)
+    invlists = index.invlists
+    return np.concatenate([
+        faiss.rev_swig_ptr(invlists.get_ids(l), invlists.list_size(l)).copy() for l in range(invlists.nlist)
+    ])
+
+def load_store_vectors(store_dir: str) -> np.ndarray:
+    index = faiss.read_index(str(Path(store_dir) / "faiss.index"))
+    try:
+        # IVF indexes need a direct map to reconstruct (PQ vectors come back approximate);
+        # a hashtable one, since the ids may have gaps
+        faiss.extract_index_ivf(index).set_direct_map_type(faiss.DirectMap.Hashtable)
+    except RuntimeError:
+        pass
+    return np.vstack([index.reconstruct(int(i)) for i in _store_ids(index)])
+
+def synthetic_vectors(n: int, dim: int = 384, clusters: int = 256, seed: int = 0) -> np.ndarray:
+    # clustered data: uniform random vectors make every ANN index look bad
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim))
+    assign = rng.integers(0, clusters, n)
+    return _normalize(centers[assign] + 0.6 * rng.standard_normal((n, dim)))
+
+def make_queries(base: np.ndarray, nq: int, seed: int = 1) -> np.ndarray:
+    # perturbed corpus vectors, like a ticket that paraphrases a doc chunk
+    rng = np.random.default_rng(seed)
+    picks = base[rng.integers(0, len(base), nq)]
+    return _normalize(picks + 0.3 * rng.standard_normal(picks.shape))
+
+def recall_at_k(truth: np.ndarray, found: np.ndarray) -> float:
+    hits = sum(len(set(t) & set(f)) for t, f in zip(truth, found))
+    return hits / truth.size
+
+def run(base: np.ndarray, queries: np.ndarray, k: int) -> list:
+    gt_index = faiss.IndexFlatIP(base.shape[1])
+    gt_index.add(base)
+    _, truth = gt_index.search(queries, k)
+
+    results = []
+    for label, overrides in CONFIGS:
+        params = {**index_params_from_env(), **overrides}
+        t0 = time.perf_counter()
+        index, effective = build_index(base, params)
+        index.add(base)
+        build_s = time.perf_counter() - t0
+        if effective["type"] != params["type"]:
+            print(f"skip {label}: corpus too small, factory fell back to {effective['type']}")
+            continue
+
+        index.search(queries[:10], k)  # warm-up
+        t0 = time.perf_counter()
+        _, found = index.search(queries, k)
+        search_s = time.perf_counter() - t0
+
+        results.append({
+            "config": label,
+            "params": effective,
+            f"recall@{k}": round(recall_at_k(truth, found), 4),
+            "qps": round(len(queries) / search_s, 1),
+            "build_s": round(build_s, 3),
+            "memory_mb": round(faiss.serialize_index(index).nbytes / 2**20, 2),
+        })
+        r = results[-1]
+        print(f"{label:22s} recall@{k}={r[f'recall@{k}']:.3f} qps={r['qps']:>10.1f} "
+              f"mem={r['memory_mb']:>8.2f}MB build={r['build_s']:.2f}s")
+    return results
+
+def bench_lexical(store_dir: str, texts: list, k: int, repeat: int = 200):
+    """Per-query latency of the BM25 side of hybrid retrieval."""
+    bm25 = BM25Index.load(store_dir)
+    if bm25 is None:
+        print("no BM25 index in the store; skipping lexical benchmark")
+        return None
+    for t in texts:
+        bm25.search(t, k)  # warm-up (touches the mapped postings)
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        for t in texts:
+            bm25.search(t, k)
+    ms = (time.perf_counter() - t0) * 1000 / (repeat * len(texts))
+    print(f"{'bm25':22s} {ms:.3f} ms/query over {len(bm25)} chunks, {len(bm25.terms)} terms")
+    return {"ms_per_query": round(ms, 4), "chunks": len(bm25), "terms": len(bm25.terms)}
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    src = ap.add_mutually_exclusive_group(required=True)
+    src.add_argument("--store", help="vector store dir to read embeddings from")
+    src.add_argument("--synthetic", type=int, help="number of synthetic vectors")
+    ap.add_argument("--queries", type=int, default=1000)
+    ap.add_argument("-k", type=int, default=4)
+    ap.add_argument("--out", default="evaluation/index_bench.json")
+    args = ap.parse_args()
+    if args.store:
+        # a snapshot root reads its live version
+        _, args.store = snapshots.resolve(args.store)
+
+    base = load_store_vectors(args.store) if args.store else synthetic_vectors(args.synthetic)
+    queries = make_queries(base, args.queries)
+    print(f"corpus={len(base)} dim={base.shape[1]} queries={len(queries)} k={args.k}")
+
+    results = run(base, queries, args.k)
+    report = {"corpus": len(base), "k": args.k, "results": results}
+    if args.store:
+        cases = json.loads(Path("evaluation/test_cases.json").read_text(encoding="utf-8"))
+        report["lexical"] = bench_lexical(args.store, [c["text"] for c in cases], args.k)
+    Path(args.out).write_text(json.dumps(report, indent=2))
+    print(f"Report written to: {args.out}")
+
+if __name__ == "__main__":
+    main()
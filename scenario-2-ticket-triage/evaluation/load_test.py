@@ -0,0 +1,104 @@
+"""Open-loop async load generator for /classify and /respond.
+
+Requests are issued on a fixed schedule (target RPS) regardless of how fast
+responses come back, so queueing in the service shows up as latency instead
+of silently lowering the offered load. Reports p50/p95/p99, errors and
+achieved throughput per endpoint.
+
+Offline, against the Gemini stub:
+
+    GEMINI_STUB=1 GEMINI_STUB_LATENCY_MS=300 uvicorn app.main:app --port 8002
+    python -m evaluation.load_test --rps 50 --duration 30
+"""
+import argparse
+import asyncio
+import json
+import subprocess
+import time
+from collections import Counter
+from pathlib import Path
+import httpx
+
+CASES_PATH = Path("evaluation/test_cases.json")
+
+def _git_rev():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def percentile(sorted_vals, p: float):
+    if not sorted_vals:
+        return None
+    return sorted_vals[min(len(sorted_vals) - 1, int(len(sorted_vals) * p))]
+
+def summarize(samples, duration_s: float) -> dict:
+    ok = sorted(lat for lat, status in samples if status == 200)
+    statuses = Counter(str(status) for _, status in samples)
+    return {
+        "requests": len(samples),
+        "ok": len(ok),
+        "errors": len(samples) - len(ok),
+        "statuses": dict(statuses),
+        "achieved_rps": round(len(ok) / duration_s, 2),
+        "p50_ms": round(percentile(ok, 0.50) * 1000, 1) if ok else None,
+        "p95_ms": round(percentile(ok, 0.95) * 1000, 1) if ok else None,
+        "p99_ms": round(percentile(ok, 0.99) * 1000, 1) if ok else None,
+    }
+
+async def run_load(base_url: str, endpoint: str, texts, rps: float, duration_s: float,
+                   unique: bool, timeout: float) -> dict:
+    samples = []
+
+    async def one(client: httpx.AsyncClient, i: int):
+        text = texts[i % len(texts)]
+        if unique:
+            # defeat the classification/embedding caches
+            text = f"{text} [load {i}]"
+        t0 = time.perf_counter()
+        try:
+            r = await client.post(f"{base_url}{endpoint}", json={"text": text, "external_id": f"load-{i}"})
+            status = r.status_code
+        except httpx.HTTPError as e:
+            status = type(e).__name__
+        samples.append((time.perf_counter() - t0, status))
+
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=256)
+    async with httpx.AsyncClient(timeout=timeout, limits=limits) as client:
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        tasks, i = [], 0
+        while (now := loop.time()) - start < duration_s:
+            due = start + i / rps
+            if due > now:
+                await asyncio.sleep(due - now)
+            tasks.append(asyncio.create_task(one(client, i)))
+            i += 1
+        await asyncio.gather(*tasks)
+    return summarize(samples, duration_s)
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--url", default="http://localhost:8002")
+    ap.add_argument("--endpoints", default="/classify,/respond")
+    ap.add_argument("--rps", type=float, default=20.0, help="target requests/sec per endpoint")
+    ap.add_argument("--duration", type=float, default=30.0, help="seconds per endpoint")
+    ap.add_argument("--unique", action="store_true", help="make every ticket text unique (cold caches)")
+    ap.add_argument("--timeout", type=float, default=30.0)
+    ap.add_argument("--out", default="evaluation/load_test.json")
+    args = ap.parse_args()
+
+    texts = [c["text"] for c in json.loads(CASES_PATH.read_text(encoding="utf-8"))]
+    report = {"git_rev": _git_rev(), "rps": args.rps, "duration_s": args.duration, "unique": args.unique,
+              "endpoints": {}}
+    for endpoint in args.endpoints.split(","):
+        r = asyncio.run(run_load(args.url, endpoint, texts, args.rps, args.duration, args.unique, args.timeout))
+        report["endpoints"][endpoint] = r
+        print(f"{endpoint:12s} {r['achieved_rps']:>7.1f} rps  p50={r['p50_ms']}ms p95={r['p95_ms']}ms "
+              f"p99={r['p99_ms']}ms errors={r['errors']}/{r['requests']}")
+
+    Path(args.out).write_text(json.dumps(report, indent=2))
+    print(f"Report written to: {args.out}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,25 @@
+# Multi-worker serving with a shared, preloaded model and index:
+#   PRELOAD_MODELS=1 gunicorn -c gunicorn.conf.py app.main:app
+# The app (and, with PRELOAD_MODELS=1, the embedder + FAISS index) is imported once in the
+# master; workers are forked from it and share those pages copy-on-write.
+import gc
+import os
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+timeout = int(os.getenv("WORKER_TIMEOUT", "60"))
+
+def pre_fork(server, worker):
+    # Move everything allocated so far out of the GC's reach, so collections in
+    # the workers don't write to (and un-share) the preloaded objects' pages.
+    gc.freeze()
+
+def post_fork(server, worker):
+    # torch thread pools don't survive fork; size them per worker
+    try:
+        import torch
+        torch.set_num_threads(int(os.getenv("TORCH_THREADS_PER_WORKER", "1")))
+    except ImportError:
+        pass